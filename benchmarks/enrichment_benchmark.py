@@ -0,0 +1,152 @@
+# This script measures YOLO inference throughput of the enrichment stage for several batch sizes
+# and inference backends.
+#
+# Usage:
+#   python benchmarks/enrichment_benchmark.py --images data/raw/images --sample 64 --batch-sizes 1,4,8,16
+#   python benchmarks/enrichment_benchmark.py --sample 64 --batch-sizes 8 --backends torch,onnx,openvino
+
+import os
+import sys
+import json
+import time
+import argparse
+
+# 'src' is the import root of the project's modules, as in the pipeline itself
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from enrichment import enrich_images
+
+
+def list_sample_images(images_dir: str, sample: int):
+    """Returns the first `sample` image paths under a folder, in a stable order."""
+    paths = []
+    for root, dirs, files in os.walk(images_dir):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.lower().endswith(enrich_images.IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, filename))
+    return paths[:sample]
+
+def percentile(values, fraction: float):
+    """Returns the value at `fraction` (0-1) of the sorted values, interpolating between neighbours."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def box_iou(a, b):
+    """Returns the intersection over union of two [x1, y1, x2, y2] boxes."""
+    width = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    height = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+def detection_agreement(reference, candidate, min_iou: float = 0.5):
+    """
+    Compares the detections of two backends on the same images. A detection
+    agrees when the other backend found the same class with a box overlapping
+    at least `min_iou`; each detection is matched at most once.
+
+    Args:
+        reference (list): One list of detections per image.
+        candidate (list): One list of detections per image, in the same order.
+
+    Returns:
+        dict: The F1-style 'agreement' (1.0 means identical sets of objects), the
+            matched and total counts, and the mean confidence difference of the matches.
+    """
+    matched = 0
+    confidence_differences = []
+    reference_count = sum(len(detections) for detections in reference)
+    candidate_count = sum(len(detections) for detections in candidate)
+    for reference_detections, candidate_detections in zip(reference, candidate):
+        unmatched = list(candidate_detections)
+        for detection in reference_detections:
+            best, best_iou = None, min_iou
+            for other in unmatched:
+                if other['detected_object_class'] != detection['detected_object_class']:
+                    continue
+                iou = box_iou(detection['bounding_box'], other['bounding_box'])
+                if iou >= best_iou:
+                    best, best_iou = other, iou
+            if best is not None:
+                unmatched.remove(best)
+                matched += 1
+                confidence_differences.append(abs(best['confidence_score'] - detection['confidence_score']))
+    total = reference_count + candidate_count
+    return {
+        'agreement': round(2 * matched / total, 4) if total else 1.0,
+        'matched': matched,
+        'reference_detections': reference_count,
+        'detections': candidate_count,
+        'mean_confidence_difference': round(sum(confidence_differences) / len(confidence_differences), 4)
+            if confidence_differences else None,
+    }
+
+def benchmark_batch_size(paths, batch_size: int, repeat: int, backend: str = 'torch'):
+    """
+    Runs inference over all `paths` in batches of `batch_size`, `repeat` times.
+
+    Returns:
+        tuple: A report with images/s over all repeats and per-batch latency
+            percentiles, and the detections of the first pass (one list per image).
+    """
+    batch_seconds = []
+    detections = []
+    started = time.perf_counter()
+    for iteration in range(repeat):
+        for start in range(0, len(paths), batch_size):
+            batch_started = time.perf_counter()
+            batch_detections = enrich_images.detect_objects_batch(paths[start:start + batch_size], backend)
+            batch_seconds.append(time.perf_counter() - batch_started)
+            if iteration == 0:
+                detections.extend(batch_detections)
+    seconds = time.perf_counter() - started
+    report = {
+        'backend': backend,
+        'batch_size': batch_size,
+        'images': len(paths) * repeat,
+        'seconds': round(seconds, 3),
+        'images_per_second': round(len(paths) * repeat / max(seconds, 1e-9), 2),
+        'mean_batch_seconds': round(sum(batch_seconds) / len(batch_seconds), 4),
+        'p50_batch_seconds': round(percentile(batch_seconds, 0.5), 4),
+        'p90_batch_seconds': round(percentile(batch_seconds, 0.9), 4),
+        'p99_batch_seconds': round(percentile(batch_seconds, 0.99), 4),
+    }
+    return report, detections
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark batched YOLO inference on a fixed sample of images.")
+    parser.add_argument('--images', default=enrich_images.RAW_IMAGES_DIR, help="Folder to take the sample images from.")
+    parser.add_argument('--sample', type=int, default=64, help="Number of images in the sample.")
+    parser.add_argument('--batch-sizes', default='1,4,8,16', help="Comma-separated batch sizes to compare.")
+    parser.add_argument('--repeat', type=int, default=1, help="Passes over the sample per batch size.")
+    parser.add_argument('--backends', default='torch',
+                        help=f"Comma-separated inference backends to compare ({', '.join(enrich_images.BACKENDS)}). "
+                             "Detection agreement is measured against the first one.")
+    args = parser.parse_args()
+
+    paths = list_sample_images(args.images, args.sample)
+    if not paths:
+        sys.exit(f"No images found in {args.images}.")
+    backends = args.backends.split(',')
+    for backend in backends:
+        if backend not in enrich_images.BACKENDS:
+            sys.exit(f"Unknown backend '{backend}'. Choose from: {', '.join(enrich_images.BACKENDS)}.")
+
+    report = []
+    reference_detections = {}
+    for backend in backends:
+        # One warm-up call so model loading (and a first export) is not counted against the first batch size
+        enrich_images.detect_objects_batch(paths[:1], backend)
+        for batch_size in args.batch_sizes.split(','):
+            result, detections = benchmark_batch_size(paths, int(batch_size), args.repeat, backend)
+            # Every backend is compared with the first one at the same batch size
+            reference = reference_detections.setdefault(batch_size, detections)
+            if backend != backends[0]:
+                result.update(detection_agreement(reference, detections))
+            report.append(result)
+    print(json.dumps(report, indent=4))
@@ -0,0 +1,124 @@
+# This script benchmarks the scraper offline against the fake Telegram client.
+#
+# Usage:
+#   python benchmarks/scraper_benchmark.py --channels 20 --messages 2000 --photo-ratio 0.3
+#   python benchmarks/scraper_benchmark.py --save-baseline benchmarks/scraper_baseline.json
+#   python benchmarks/scraper_benchmark.py --baseline benchmarks/scraper_baseline.json --tolerance 0.2
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import tracemalloc
+
+# Make the 'scraping' package importable the same way src/main.py does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from scraping import scraper
+from scraping.fake_client import FakeTelegramClient
+
+
+def run_benchmark(args):
+    """
+    Runs one full scrape against the fake client inside a temporary directory.
+
+    Returns:
+        dict: Throughput and memory figures for the run.
+    """
+    channels = [f"bench_channel_{i}" for i in range(args.channels)]
+    client = FakeTelegramClient(
+        channels=channels, messages_per_channel=args.messages, photo_ratio=args.photo_ratio,
+        photo_size=args.photo_size, latency=args.latency, download_latency=args.download_latency,
+        flood_wait_every=args.flood_every, flood_wait_seconds=args.flood_seconds
+    )
+
+    # Fetch every message and don't let the rate limiter dominate the measurement
+    scraper.SCRAPE_LIMIT = None
+    scraper.SCRAPE_RATE_PER_SECOND = args.rate
+    scraper.SCRAPE_BURST = max(scraper.SCRAPE_BURST, int(args.rate))
+
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        # All lake paths are relative, so the run writes only inside the temporary directory
+        os.chdir(workdir)
+        try:
+            tracemalloc.start()
+            started = time.perf_counter()
+            results = asyncio.run(scraper.scrape_all_channels(client, channels=channels, concurrency=args.concurrency))
+            seconds = time.perf_counter() - started
+            _, peak_traced = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            os.chdir(original_dir)
+
+    messages = sum(stats['messages'] for stats in results)
+    photos = sum(stats['photos'] for stats in results)
+    return {
+        'channels': args.channels,
+        'messages': messages,
+        'photos': photos,
+        'seconds': round(seconds, 3),
+        'messages_per_second': round(messages / seconds, 1),
+        'photos_per_second': round(photos / seconds, 1),
+        'peak_python_memory_mb': round(peak_traced / 1024 / 1024, 1),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'flood_waits': client.flood_waits_raised,
+        'failed_channels': sum(1 for stats in results if stats['status'] != 'ok'),
+    }
+
+def check_regression(report, baseline, tolerance):
+    """
+    Compares a report with a saved baseline.
+
+    Returns:
+        list: Descriptions of every metric that regressed by more than `tolerance`.
+    """
+    regressions = []
+    for metric in ('messages_per_second', 'photos_per_second'):
+        if baseline.get(metric) and report[metric] < baseline[metric] * (1 - tolerance):
+            regressions.append(f"{metric}: {report[metric]} < baseline {baseline[metric]}")
+    if baseline.get('peak_python_memory_mb') and \
+            report['peak_python_memory_mb'] > baseline['peak_python_memory_mb'] * (1 + tolerance):
+        regressions.append(
+            f"peak_python_memory_mb: {report['peak_python_memory_mb']} > baseline {baseline['peak_python_memory_mb']}"
+        )
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the Telegram scraper offline.")
+    parser.add_argument('--channels', type=int, default=10, help="Number of synthetic channels.")
+    parser.add_argument('--messages', type=int, default=1000, help="Messages per channel.")
+    parser.add_argument('--photo-ratio', type=float, default=0.3, help="Share of messages with a photo.")
+    parser.add_argument('--photo-size', type=int, default=64 * 1024, help="Bytes per synthetic photo.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds per simulated API request.")
+    parser.add_argument('--download-latency', type=float, default=0.0, help="Seconds per simulated photo download.")
+    parser.add_argument('--flood-every', type=int, default=0, help="Inject a FloodWait every N requests (0 = never).")
+    parser.add_argument('--flood-seconds', type=int, default=1, help="Wait time of injected FloodWaits.")
+    parser.add_argument('--concurrency', type=int, default=scraper.SCRAPE_CONCURRENCY, help="Channels scraped at once.")
+    parser.add_argument('--rate', type=float, default=1000.0, help="Rate limiter requests per second.")
+    parser.add_argument('--save-baseline', help="Write the report to this JSON file.")
+    parser.add_argument('--baseline', help="Compare against this JSON report and exit with status 1 on regression.")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed relative regression against the baseline.")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    report = run_benchmark(args)
+    print(json.dumps(report, indent=4))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = check_regression(report, json.load(f), args.tolerance)
+        if regressions:
+            print("Performance regression detected:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No regression against the baseline.")
@@ -0,0 +1,20 @@
+-- Increments raw.data_version after dbt has rebuilt models, so the API drops its cached
+-- report responses. The loaders bump the same row (see src/loading/data_version.py).
+-- Runs from the on-run-end hook; `dbt test` and other read-only commands leave the version alone.
+
+{% macro bump_data_version() %}
+    {% if execute and flags.WHICH in ('run', 'build', 'seed') %}
+        CREATE SCHEMA IF NOT EXISTS raw;
+        CREATE TABLE IF NOT EXISTS raw.data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version BIGINT NOT NULL,
+            updated_by TEXT,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+        INSERT INTO raw.data_version (id, version, updated_by) VALUES (1, 1, 'dbt')
+        ON CONFLICT (id) DO UPDATE
+        SET version = data_version.version + 1, updated_by = EXCLUDED.updated_by, updated_at = NOW();
+    {% else %}
+        SELECT 1;
+    {% endif %}
+{% endmacro %}
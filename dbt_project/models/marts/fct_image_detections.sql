@@ -1,6 +1,24 @@
+-- This model builds a structured fact table from the YOLO detection results.
+-- The loader stores them either as JSON arrays (`raw_data.image_detections`) or,
+-- with `DETECTION_LOAD_FORMAT=rows`, as typed rows (`raw_data.image_detection_rows`).
+-- Set the `detections_format` var to 'rows' to read the typed table.
 
--- This model reads the raw JSON data from image detections, unnests it,
--- and creates a structured fact table.
+{% if var('detections_format', 'jsonb') == 'rows' %}
+
+-- The typed table already holds one row per detection, so no JSON has to be expanded.
+SELECT
+    message_id::INTEGER AS message_id,
+    channel_name,
+    detected_object_class,
+    confidence_score::FLOAT AS confidence_score,
+    box_x1::FLOAT AS box_x1,
+    box_y1::FLOAT AS box_y1,
+    box_x2::FLOAT AS box_x2,
+    box_y2::FLOAT AS box_y3,
+    model_version
+FROM {{ source('raw_data', 'image_detection_rows') }}
+
+{% else %}
 
 WITH raw_image_detections AS (
     -- This CTE should point to the table where you load your raw JSON detection data.
@@ -24,12 +42,17 @@ unpacked_detections AS (
 -- Final selection and type casting to build our clean fact table.
 SELECT
     (detection ->> 'message_id')::INTEGER AS message_id,
+    detection ->> 'channel_name' AS channel_name,
     detection ->> 'detected_object_class' AS detected_object_class,
     (detection ->> 'confidence_score')::FLOAT AS confidence_score,
     -- Extract bounding box coordinates from the nested array
     (detection -> 'bounding_box' ->> 0)::FLOAT AS box_x1,
     (detection -> 'bounding_box' ->> 1)::FLOAT AS box_y1,
     (detection -> 'bounding_box' ->> 2)::FLOAT AS box_x2,
-    (detection -> 'bounding_box' ->> 3)::FLOAT AS box_y3
+    (detection -> 'bounding_box' ->> 3)::FLOAT AS box_y3,
+    -- Only set for detections written by the shard-based enrichment stage
+    detection ->> 'model_version' AS model_version
 FROM
     unpacked_detections
+
+{% endif %}
@@ -1,5 +1,20 @@
 -- models/marts/fct_messages.sql
 
+-- `message_tsv` holds the searchable lexemes of each message and is indexed with GIN, so API
+-- searches use the index instead of scanning the table. The 'simple' text search configuration
+-- (the `search_text_config` var) lowercases words without English stemming, which suits the
+-- mix of Amharic and English in the channels. Set `enable_trigram_search` to also build a
+-- pg_trgm index on message_text for substring and fuzzy matching.
+{% set search_indexes = [{'columns': ['message_tsv'], 'type': 'gin'}] %}
+{% if var('enable_trigram_search', false) %}
+    {% do search_indexes.append({'columns': ['message_text gin_trgm_ops'], 'type': 'gin'}) %}
+{% endif %}
+
+{{ config(
+    indexes=search_indexes,
+    pre_hook="CREATE EXTENSION IF NOT EXISTS pg_trgm" if var('enable_trigram_search', false) else []
+) }}
+
 WITH messages AS (
     SELECT * FROM {{ ref('stg_telegram_messages') }}
 ),
@@ -22,7 +37,10 @@ SELECT
     dates.date_key,
 
     -- Message content and metrics
-    messages.message_text
+    messages.message_text,
+
+    -- Full-text search vector, see the note at the top
+    to_tsvector('{{ var("search_text_config", "simple") }}', COALESCE(messages.message_text, '')) AS message_tsv
 FROM
     messages
 -- Join on the channel_name column, which exists in both models
@@ -0,0 +1,73 @@
+-- This model counts the messages mentioning each product, per channel and day.
+-- Products and their aliases come from the `products` seed, so the list can change without
+-- a deploy (run `dbt seed` and then `dbt run --full-refresh -s fct_product_mentions`).
+-- All aliases are matched in one pass over the messages, and a message mentioning a product
+-- through several aliases counts once.
+--
+-- The model is incremental: each run deletes the days from the latest loaded day minus
+-- `product_mentions_lookback_days` (pre-hook, in the model's transaction) and rebuilds every day
+-- after the last one kept. Late messages for recent days are counted, and counts of deleted or
+-- edited messages disappear instead of lingering.
+
+{{ config(
+    materialized='incremental',
+    incremental_strategy='append',
+    pre_hook="
+        {% if is_incremental() %}
+            DELETE FROM {{ this }}
+            WHERE mention_date >= (
+                SELECT MAX(mention_date) - {{ var('product_mentions_lookback_days', 3) }} FROM {{ this }}
+            )
+        {% endif %}
+    ",
+    indexes=[
+        {'columns': ['mention_date']},
+        {'columns': ['product_name', 'mention_date']},
+        {'columns': ['channel_name', 'mention_date']},
+    ]
+) }}
+
+WITH messages AS (
+    SELECT
+        channel_name,
+        message_id,
+        message_date::date AS mention_date,
+        LOWER(message_text) AS message_text
+    FROM {{ ref('stg_telegram_messages') }}
+    WHERE message_text IS NOT NULL
+    {% if is_incremental() %}
+        -- Every day after the last one the pre-hook kept, so no rebuilt day is stored twice
+        AND message_date >= (
+            SELECT COALESCE(MAX(mention_date) + 1, '1900-01-01'::date)
+            FROM {{ this }}
+        )
+    {% endif %}
+),
+
+aliases AS (
+    SELECT
+        LOWER(product_name) AS product_name,
+        LOWER(alias) AS alias
+    FROM {{ ref('products') }}
+),
+
+mentions AS (
+    -- One row per message and product, however many aliases of the product it contains
+    SELECT DISTINCT
+        messages.channel_name,
+        messages.message_id,
+        messages.mention_date,
+        aliases.product_name
+    FROM messages
+    JOIN aliases ON POSITION(aliases.alias IN messages.message_text) > 0
+)
+
+SELECT
+    mentions.mention_date,
+    channels.channel_key,
+    mentions.channel_name,
+    mentions.product_name,
+    COUNT(*) AS mention_count
+FROM mentions
+LEFT JOIN {{ ref('dim_channels') }} AS channels ON mentions.channel_name = channels.channel_name
+GROUP BY 1, 2, 3, 4
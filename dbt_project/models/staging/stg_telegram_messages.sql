@@ -7,8 +7,9 @@ with source as (
 renamed as (
     select
         channel_name,
-        (message_data ->> 'id')::bigint as message_id,
-        (message_data ->> 'date')::timestamp as message_date,
+        message_id,
+        -- Typed column set by the loader; filtering on it prunes partitions of raw.raw_messages
+        message_date,
         message_data ->> 'text' as message_text,
         (message_data ->> 'sender_id')::bigint as sender_id,
         message_data ->> 'photo_path' as photo_path
@@ -0,0 +1,222 @@
+# src/api/cache.py
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from sqlalchemy import text
+
+try:
+    import redis
+except ImportError: # redis is optional, only needed for API_CACHE_BACKEND=redis
+    redis = None
+
+# This file contains the response cache of the report endpoints. The reports only
+# change when the pipeline loads data or dbt rebuilds the marts, and both bump the
+# data version in raw.data_version; cached responses of older versions are never served.
+
+# --- Cache Settings ---
+API_CACHE_BACKEND = os.getenv("API_CACHE_BACKEND", "memory") # 'memory', 'redis' or 'none'
+API_CACHE_TTL_SECONDS = float(os.getenv("API_CACHE_TTL_SECONDS", 300))
+API_CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", 1024)) # LRU limit of the memory backend
+API_CACHE_REDIS_URL = os.getenv("API_CACHE_REDIS_URL", "redis://localhost:6379/0")
+# How long a data version read from the database is trusted before it is checked again
+API_CACHE_VERSION_CHECK_SECONDS = float(os.getenv("API_CACHE_VERSION_CHECK_SECONDS", 5))
+
+
+class MemoryBackend:
+    """An in-process store with a TTL per entry and least-recently-used eviction."""
+
+    def __init__(self, max_entries: int = API_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict() # key -> (expires_at, value), least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Returns (True, value) for a live entry, or (False, None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """
+    Stores entries in Redis, so several API processes share them. Values are
+    stored as JSON and expire through Redis TTLs; Redis applies its own
+    eviction policy (e.g. allkeys-lru) when it is full.
+    """
+
+    def __init__(self, url: str = API_CACHE_REDIS_URL, prefix: str = "api-cache:"):
+        if redis is None:
+            raise ImportError("API_CACHE_BACKEND=redis requires the 'redis' package.")
+        self.prefix = prefix
+        self.evictions = 0 # Evictions happen inside Redis and are not counted here
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str):
+        value = self._client.get(self.prefix + key)
+        return (False, None) if value is None else (True, json.loads(value))
+
+    def set(self, key: str, value, ttl: float):
+        self._client.set(self.prefix + key, json.dumps(value, default=str), px=int(ttl * 1000))
+
+    def clear(self):
+        for key in self._client.scan_iter(match=self.prefix + "*"):
+            self._client.delete(key)
+
+    def __len__(self):
+        return sum(1 for _ in self._client.scan_iter(match=self.prefix + "*"))
+
+
+class ResponseCache:
+    """
+    Caches computed responses by key for `ttl` seconds.
+
+    Every key is prefixed with the current data version, so a new version makes
+    all older entries unreachable (and the memory backend is cleared). Concurrent
+    requests for the same missing key are coalesced: the first one computes the
+    response and the others wait for its result instead of querying too.
+    """
+
+    def __init__(self, backend, version_source, ttl: float = API_CACHE_TTL_SECONDS,
+                 version_check_seconds: float = API_CACHE_VERSION_CHECK_SECONDS):
+        """
+        Args:
+            backend: A MemoryBackend, RedisBackend or any object with get/set/clear.
+            version_source: A callable returning the current data version.
+            ttl (float): Seconds an entry is served for.
+            version_check_seconds (float): Seconds a data version is trusted before it is read again.
+        """
+        self.backend = backend
+        self.version_source = version_source
+        self.ttl = ttl
+        self.version_check_seconds = version_check_seconds
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self._version = None
+        self._version_checked_at = 0.0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def data_version(self):
+        """Returns the data version, reading it at most every `version_check_seconds` seconds."""
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_seconds:
+            return self._version
+        version = self.version_source()
+        with self._lock:
+            if self._version is not None and version != self._version:
+                self.backend.clear()
+                self.invalidations += 1
+            self._version = version
+            self._version_checked_at = now
+        return version
+
+    def get_or_compute(self, key: str, compute):
+        """
+        Returns the cached response for `key`, or computes, caches and returns it.
+        Exceptions of `compute` reach every coalesced caller and are not cached.
+        """
+        key = f"{self.data_version()}:{key}"
+        found, value = self.backend.get(key)
+        if found:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            value = compute()
+            self.backend.set(key, value, self.ttl)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self):
+        """Returns the hit, miss and coalescing counters and the cache size."""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "backend": type(self.backend).__name__,
+            "data_version": self._version,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else None,
+            "evictions": self.backend.evictions,
+            "invalidations": self.invalidations,
+            "ttl_seconds": self.ttl,
+        }
+
+
+def read_data_version(session_factory):
+    """
+    Returns a callable that reads raw.data_version with a new session, or 0
+    while the table does not exist yet.
+    """
+    def version_source():
+        db = session_factory()
+        try:
+            return db.execute(text("SELECT version FROM raw.data_version WHERE id = 1;")).scalar() or 0
+        except Exception:
+            db.rollback()
+            return 0
+        finally:
+            db.close()
+    return version_source
+
+def create_cache(session_factory, backend_name: str = API_CACHE_BACKEND):
+    """
+    Builds the response cache for the configured backend, or None when caching
+    is turned off with API_CACHE_BACKEND=none.
+    """
+    if backend_name == "none":
+        return None
+    if backend_name == "redis":
+        backend = RedisBackend()
+    elif backend_name == "memory":
+        backend = MemoryBackend()
+    else:
+        raise ValueError(f"Unknown API_CACHE_BACKEND '{backend_name}'. Expected 'memory', 'redis' or 'none'.")
+    return ResponseCache(backend, read_data_version(session_factory))
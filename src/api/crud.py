@@ -1,27 +1,65 @@
 # src/api/crud.py
 
+import os
+import re
 from sqlalchemy.orm import Session
-from sqlalchemy import func, text
+from sqlalchemy import func, text, cast
+from sqlalchemy.dialects.postgresql import REGCONFIG, TIMESTAMP, DATE
 from . import models, schemas
 
+# Must match the dbt var 'search_text_config' that fct_messages.message_tsv is built with
+SEARCH_TEXT_CONFIG = os.getenv('SEARCH_TEXT_CONFIG', 'simple')
+
 # This file contains functions that directly interact with the database
 # to read or write data.
 
-def search_messages(db: Session, query: str, skip: int = 0, limit: int = 100):
+def _text_search_query(query: str, mode: schemas.SearchMode):
+    """Builds the tsquery for a full-text search mode."""
+    config = cast(SEARCH_TEXT_CONFIG, REGCONFIG)
+    if mode == schemas.SearchMode.phrase:
+        return func.phraseto_tsquery(config, query)
+    if mode == schemas.SearchMode.prefix:
+        # Only word characters reach to_tsquery, so user input cannot break its syntax
+        terms = re.findall(r"\w+", query)
+        return func.to_tsquery(config, " & ".join(f"{term}:*" for term in terms))
+    return func.websearch_to_tsquery(config, query)
+
+def trigram_search_available(db: Session):
+    """Returns True if the pg_trgm extension that the 'fuzzy' search mode needs is installed."""
+    return db.execute(text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm');")).scalar()
+
+def search_messages(db: Session, query: str, mode: schemas.SearchMode = schemas.SearchMode.words,
+                    skip: int = 0, limit: int = 100):
     """
-    Searches for messages containing a specific query string in their text.
+    Searches for messages matching a query, most relevant first.
+
+    The 'words', 'phrase' and 'prefix' modes use the GIN-indexed full-text
+    search vector, ranked by ts_rank_cd. 'substring' and 'fuzzy' match the raw
+    text (using the trigram index when dbt built it); 'fuzzy' ranks by similarity
+    and needs pg_trgm (see trigram_search_available).
     
     Args:
         db: The database session.
         query: The text to search for within messages.
+        mode: How the query is matched (see schemas.SearchMode).
         skip: The number of records to skip (for pagination).
         limit: The maximum number of records to return.
         
     Returns:
         A list of Message objects that match the query.
     """
-    # Using 'ilike' for case-insensitive search
-    return db.query(models.Message).filter(models.Message.message_text.ilike(f"%{query}%")).offset(skip).limit(limit).all()
+    messages = db.query(models.Message)
+    if mode == schemas.SearchMode.substring:
+        messages = messages.filter(models.Message.message_text.ilike(f"%{query}%"))\
+                           .order_by(models.Message.message_id.desc())
+    elif mode == schemas.SearchMode.fuzzy:
+        messages = messages.filter(models.Message.message_text.op('%')(query))\
+                           .order_by(func.similarity(models.Message.message_text, query).desc(), models.Message.message_id.desc())
+    else:
+        tsquery = _text_search_query(query, mode)
+        messages = messages.filter(models.Message.message_tsv.op('@@')(tsquery))\
+                           .order_by(func.ts_rank_cd(models.Message.message_tsv, tsquery).desc(), models.Message.message_id.desc())
+    return messages.offset(skip).limit(limit).all()
 
 
 def get_channel_activity(db: Session, channel_name: str):
@@ -48,37 +86,56 @@ def get_channel_activity(db: Session, channel_name: str):
     return activity
 
 
-def get_top_products(db: Session, limit: int = 10):
+def _filter_product_mentions(query, product_name: str = None, channel_name: str = None,
+                             start_date=None, end_date=None):
+    """Applies the optional product, channel and date range filters to a fct_product_mentions query."""
+    if product_name:
+        query = query.filter(models.ProductMention.product_name == product_name.lower())
+    if channel_name:
+        query = query.filter(models.ProductMention.channel_name == channel_name)
+    if start_date:
+        query = query.filter(models.ProductMention.mention_date >= start_date)
+    if end_date:
+        query = query.filter(models.ProductMention.mention_date <= end_date)
+    return query
+
+
+def get_top_products(db: Session, limit: int = 10, channel_name: str = None, start_date=None, end_date=None):
     """
-    Finds the most frequently mentioned products across all messages by searching
-    for a predefined list of keywords.
+    Finds the most frequently mentioned products, optionally within a channel
+    and date range.
+
+    The counts come from the precomputed `fct_product_mentions` mart (one row per
+    product, channel and day), so this is a single aggregate over a small table
+    instead of a scan of every message per product.
     """
-    # In a real-world scenario, this list could come from a dedicated table or a config file.
-    # We are expanding the list for a more realistic search.
-    product_keywords = [
-        "paracetamol", "amoxicillin", "vitamin c", "ibuprofen", "aspirin",
-        "panadol", "augmentin", "ciprofloxacin", "metformin", "salbutamol",
-        "diclofenac", "omeprazole", "azithromycin", "doxycycline", "prednisolone"
+    total = func.sum(models.ProductMention.mention_count).label('mention_count')
+    query = db.query(models.ProductMention.product_name, total)
+    query = _filter_product_mentions(query, channel_name=channel_name, start_date=start_date, end_date=end_date)
+    rows = query.group_by(models.ProductMention.product_name)\
+                .order_by(total.desc(), models.ProductMention.product_name)\
+                .limit(limit)\
+                .all()
+    return [{"product_name": row.product_name, "mention_count": int(row.mention_count)} for row in rows]
+
+
+def get_product_mention_timeseries(db: Session, grain: schemas.TimeGrain = schemas.TimeGrain.day,
+                                   product_name: str = None, channel_name: str = None,
+                                   start_date=None, end_date=None):
+    """
+    Returns the number of messages mentioning each product per channel and
+    period ('day', 'week' or 'month'), ordered by period.
+    """
+    period = cast(func.date_trunc(grain.value, cast(models.ProductMention.mention_date, TIMESTAMP)), DATE).label('period')
+    total = func.sum(models.ProductMention.mention_count).label('mention_count')
+    query = db.query(period, models.ProductMention.product_name, models.ProductMention.channel_name, total)
+    query = _filter_product_mentions(query, product_name, channel_name, start_date, end_date)
+    rows = query.group_by(period, models.ProductMention.product_name, models.ProductMention.channel_name)\
+                .order_by(period, models.ProductMention.product_name, models.ProductMention.channel_name)\
+                .all()
+    return [
+        {"period": row.period, "product_name": row.product_name,
+         "channel_name": row.channel_name, "mention_count": int(row.mention_count)}
+        for row in rows
     ]
-    
-    mention_counts = []
-    
-    # This loop executes a separate query for each keyword.
-    # While not the most performant on huge datasets, it's clear, robust,
-    # and works well for this use case.
-    for product in product_keywords:
-        # Using f-string for the search term is safe here because it's not user input.
-        # The query counts rows where the message_text contains the product keyword.
-        count = db.query(func.count(models.Message.message_key))\
-                  .filter(models.Message.message_text.ilike(f"%{product}%"))\
-                  .scalar() # .scalar() returns a single value
-        
-        if count > 0:
-            mention_counts.append({"product_name": product, "mention_count": count})
-            
-    # Sort the results by mention_count in descending order
-    sorted_products = sorted(mention_counts, key=lambda x: x['mention_count'], reverse=True)
-    
-    # Return the top N results based on the limit
-    return sorted_products[:limit]
 
@@ -2,8 +2,10 @@
 
 from fastapi import Depends, FastAPI, HTTPException
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import date
 from . import crud, models, schemas
+from .cache import create_cache
 from .database import SessionLocal, engine
 
 # This line is commented out because dbt is responsible for creating tables.
@@ -12,6 +14,18 @@ from .database import SessionLocal, engine
 
 app = FastAPI()
 
+# --- Response Cache ---
+# Report responses are cached until the data version changes (bumped by the loaders and dbt)
+# or their TTL runs out. None when API_CACHE_BACKEND=none.
+response_cache = create_cache(SessionLocal)
+
+def cached(endpoint: str, compute, **params):
+    """Returns the cached response of an endpoint for the given parameters, computing it on a miss."""
+    if response_cache is None:
+        return compute()
+    key = endpoint + "?" + "&".join(f"{name}={value}" for name, value in sorted(params.items()))
+    return response_cache.get_or_compute(key, compute)
+
 # --- Dependency ---
 # This function provides a database session to the API endpoints.
 # It ensures that the database session is always closed after the request
@@ -32,15 +46,23 @@ def read_root():
 
 
 @app.get("/api/search/messages", response_model=List[schemas.Message])
-def search_for_messages(query: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def search_for_messages(query: str, mode: schemas.SearchMode = schemas.SearchMode.words, skip: int = 0,
+                        limit: int = 100, db: Session = Depends(get_db)):
     """
-    Searches for messages containing a specific query string.
+    Searches for messages matching a query, ranked by relevance.
     
     - **query**: The keyword to search for in message text.
+    - **mode**: 'words' (default), 'phrase', 'prefix', 'substring' or 'fuzzy'.
     - **skip**: Number of records to skip for pagination.
     - **limit**: Maximum number of records to return.
     """
-    messages = crud.search_messages(db, query=query, skip=skip, limit=limit)
+    if mode == schemas.SearchMode.fuzzy and not crud.trigram_search_available(db):
+        raise HTTPException(
+            status_code=501,
+            detail="Fuzzy search needs the pg_trgm extension. Run dbt with --vars '{enable_trigram_search: true}' "
+                   "or use mode=substring."
+        )
+    messages = crud.search_messages(db, query=query, mode=mode, skip=skip, limit=limit)
     return messages
 
 
@@ -52,23 +74,59 @@ def get_channel_activity_report(channel_name: str, db: Session = Depends(get_db)
     
     - **channel_name**: The name of the channel to retrieve activity for.
     """
-    activity = crud.get_channel_activity(db, channel_name=channel_name)
+    def compute():
+        activity = crud.get_channel_activity(db, channel_name=channel_name)
+        return {"channel_name": activity.channel_name, "total_messages": activity.total_messages} if activity else None
+
+    activity = cached("channel-activity", compute, channel_name=channel_name)
     if not activity:
         raise HTTPException(status_code=404, detail="Channel not found")
-    return schemas.ChannelActivity(channel_name=activity.channel_name, total_messages=activity.total_messages)
+    return schemas.ChannelActivity(**activity)
 
 
 @app.get("/api/reports/top-products", response_model=List[schemas.TopProduct])
-def get_top_products_report(limit: int = 10, db: Session = Depends(get_db)):
+def get_top_products_report(limit: int = 10, channel_name: Optional[str] = None, start_date: Optional[date] = None,
+                            end_date: Optional[date] = None, db: Session = Depends(get_db)):
     """
     Returns a list of the most frequently mentioned products across all channels.
     
     - **limit**: The maximum number of top products to return.
+    - **channel_name**, **start_date**, **end_date**: Optional filters.
     """
-    top_products = crud.get_top_products(db, limit=limit)
+    top_products = cached(
+        "top-products",
+        lambda: crud.get_top_products(db, limit=limit, channel_name=channel_name, start_date=start_date, end_date=end_date),
+        limit=limit, channel_name=channel_name, start_date=start_date, end_date=end_date
+    )
     # --- FIX: Access dictionary items using square brackets ---
     # The crud function returns a list of dictionaries, so we need to use
     # key-based access (e.g., p['product_name']) instead of attribute-based
     # access (p.product_name).
     return [schemas.TopProduct(product_name=p['product_name'], mention_count=p['mention_count']) for p in top_products]
 
+
+@app.get("/api/reports/product-mentions", response_model=List[schemas.ProductMentionPoint])
+def get_product_mentions_report(grain: schemas.TimeGrain = schemas.TimeGrain.day, product_name: Optional[str] = None,
+                                channel_name: Optional[str] = None, start_date: Optional[date] = None,
+                                end_date: Optional[date] = None, db: Session = Depends(get_db)):
+    """
+    Returns a time series of product mentions by channel.
+    
+    - **grain**: 'day' (default), 'week' or 'month'.
+    - **product_name**, **channel_name**, **start_date**, **end_date**: Optional filters.
+    """
+    points = cached(
+        "product-mentions",
+        lambda: crud.get_product_mention_timeseries(db, grain=grain, product_name=product_name, channel_name=channel_name,
+                                                    start_date=start_date, end_date=end_date),
+        grain=grain.value, product_name=product_name, channel_name=channel_name, start_date=start_date, end_date=end_date
+    )
+    return [schemas.ProductMentionPoint(**point) for point in points]
+
+
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """Returns the hit, miss and coalescing counters of the report response cache."""
+    if response_cache is None:
+        return {"backend": "none"}
+    return response_cache.stats()
@@ -1,7 +1,8 @@
 # src/api/models.py
 
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Date, DateTime, Float, ForeignKey
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from .database import Base
 
 SCHEMA_NAME = "public_marts"
@@ -35,6 +36,22 @@ class Message(Base):
     channel_key = Column(String, ForeignKey(f'{SCHEMA_NAME}.dim_channels.channel_key'))
     date_key = Column(Integer)
     message_text = Column(String)
+    # Full-text search vector built by dbt (GIN-indexed). Deferred, so it is only loaded when used.
+    message_tsv = deferred(Column(TSVECTOR))
     
     channel = relationship("Channel", back_populates="messages")
 
+
+class ProductMention(Base):
+    """
+    SQLAlchemy ORM model for the 'fct_product_mentions' table: the number of
+    messages mentioning a product, per channel and day.
+    """
+    __tablename__ = 'fct_product_mentions'
+    __table_args__ = {'schema': SCHEMA_NAME}
+
+    mention_date = Column(Date, primary_key=True)
+    channel_name = Column(String, primary_key=True)
+    product_name = Column(String, primary_key=True)
+    channel_key = Column(String)
+    mention_count = Column(Integer)
@@ -1,5 +1,7 @@
 # src/api/schemas.py
 
+from enum import Enum
+from datetime import date
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -45,6 +47,14 @@ class Channel(ChannelBase):
 
 # --- Schemas for Specific Endpoints ---
 
+class SearchMode(str, Enum):
+    """How the search endpoint matches the query."""
+    words = "words" # All words, in any order (supports "quoted phrases", OR and -exclusions)
+    phrase = "phrase" # The words next to each other, in order
+    prefix = "prefix" # Words starting with each query term, e.g. 'amox' finds 'amoxicillin'
+    substring = "substring" # The query anywhere in the text (fast with the optional trigram index)
+    fuzzy = "fuzzy" # Texts similar to the query, tolerating typos (requires pg_trgm)
+
 class ChannelActivity(BaseModel):
     """Schema for the channel activity endpoint response."""
     channel_name: str
@@ -54,3 +64,16 @@ class TopProduct(BaseModel):
     """Schema for the top products report."""
     product_name: str
     mention_count: int
+
+class TimeGrain(str, Enum):
+    """Period length of the product mention time series."""
+    day = "day"
+    week = "week"
+    month = "month"
+
+class ProductMentionPoint(BaseModel):
+    """Schema for one point of the product mention time series."""
+    period: date
+    product_name: str
+    channel_name: str
+    mention_count: int
@@ -0,0 +1,166 @@
+# This file contains the writer of detection shards: newline-delimited detection records, one shard per run and process.
+
+import os
+import json
+import time
+import logging
+from datetime import datetime, timezone
+
+try:
+    import fcntl # Used to tell a shard that is still being written from one left by a crashed run
+except ImportError:
+    fcntl = None
+
+SHARD_SUFFIX = '.ndjson'
+INDEX_SUFFIX = '.index.json'
+SHARD_MAX_RECORDS = int(os.getenv('DETECTION_SHARD_MAX_RECORDS', 100000)) # Records per shard before a new one is started
+ORPHANED_SHARD_SECONDS = 3600 # Without file locks, an unindexed shard untouched this long is treated as orphaned
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+def index_path(shard_path: str):
+    """Returns the path of a shard's index file."""
+    return shard_path[:-len(SHARD_SUFFIX)] + INDEX_SUFFIX
+
+def _write_index(shard_path: str, summary: dict):
+    """Writes a shard's index atomically. A shard only counts as complete once its index exists."""
+    temp_path = f"{index_path(shard_path)}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(summary, f, indent=4)
+    os.replace(temp_path, index_path(shard_path))
+
+def _summarize(entries, shard_path: str, model_version: str = None, created_at: str = None):
+    """Builds the index of a shard from (channel_name, message_id, detection count) entries of its records."""
+    channels = {}
+    for channel_name, message_id, _ in entries:
+        channel = channels.setdefault(channel_name or '', {'records': 0, 'min_message_id': None, 'max_message_id': None})
+        channel['records'] += 1
+        if channel['min_message_id'] is None or message_id < channel['min_message_id']:
+            channel['min_message_id'] = message_id
+        if channel['max_message_id'] is None or message_id > channel['max_message_id']:
+            channel['max_message_id'] = message_id
+    return {
+        'shard': os.path.basename(shard_path),
+        'model_version': model_version,
+        'records': len(entries),
+        'detections': sum(count for _, _, count in entries),
+        'bytes': os.path.getsize(shard_path),
+        'channels': channels,
+        'created_at': created_at,
+        'closed_at': _now(),
+    }
+
+
+class DetectionShardWriter:
+    """
+    Appends one record per message to a newline-delimited shard:
+
+        {"key": "<channel>/<message_id>", "channel_name": ..., "message_id": ...,
+         "model_version": ..., "image_path": ..., "content_hash": ..., "detections": [...]}
+
+    Records are keyed by channel plus message id, so messages of different
+    channels never overwrite each other. Every process writes its own shards
+    named after the run and the process id. A shard gets its index file when
+    it is closed, which is when the loader may pick it up.
+    """
+
+    def __init__(self, directory: str, model_version: str, run_id: str = None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.model_version = model_version
+        self.run_id = run_id or datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+        self._part = 0
+        self._file = None
+        self._entries = []
+
+    def _open(self):
+        self._path = os.path.join(self.directory, f"{self.run_id}-{os.getpid()}-{self._part:04d}{SHARD_SUFFIX}")
+        self._created_at = _now()
+        self._file = open(self._path, 'a', encoding='utf-8')
+        if fcntl:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._entries = []
+
+    def write(self, channel_name, message_id: int, detections, image_path: str = None, content_hash: str = None):
+        """Appends the detections of one message and flushes them to the file."""
+        if self._file is None:
+            self._open()
+        record = {
+            'key': f"{channel_name or ''}/{message_id}",
+            'channel_name': channel_name,
+            'message_id': message_id,
+            'model_version': self.model_version,
+            'image_path': image_path,
+            'content_hash': content_hash,
+            'detections': detections,
+        }
+        self._file.write(json.dumps(record) + '\n')
+        # Flushed before the image is marked as processed, so a crash never loses a recorded message
+        self._file.flush()
+        self._entries.append((channel_name, message_id, len(detections)))
+        if len(self._entries) >= SHARD_MAX_RECORDS:
+            self._seal()
+            self._part += 1
+
+    def _seal(self):
+        """Closes the current shard and writes its index."""
+        self._file.close()
+        self._file = None
+        _write_index(self._path, _summarize(self._entries, self._path, self.model_version, self._created_at))
+        logging.info(f"Wrote {len(self._entries)} detection records to {self._path}.")
+
+    def close(self):
+        if self._file is not None:
+            self._seal()
+
+
+def _is_orphaned(shard_path: str):
+    """Returns True if no running process is writing to a shard without an index."""
+    if fcntl is None:
+        return time.time() - os.path.getmtime(shard_path) > ORPHANED_SHARD_SECONDS
+    with open(shard_path, 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        fcntl.flock(f, fcntl.LOCK_UN)
+    return True
+
+def seal_orphaned_shards(directory: str):
+    """
+    Indexes the shards of runs that stopped before closing them, so their
+    records (already marked as processed) still reach the loader. A partly
+    written last line is cut off first.
+
+    Returns:
+        int: The number of shards sealed.
+    """
+    if not os.path.isdir(directory):
+        return 0
+    sealed = 0
+    for name in sorted(os.listdir(directory)):
+        shard_path = os.path.join(directory, name)
+        if not name.endswith(SHARD_SUFFIX) or os.path.exists(index_path(shard_path)) or not _is_orphaned(shard_path):
+            continue
+        entries = []
+        model_version = None
+        valid_bytes = 0
+        with open(shard_path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                entries.append((record['channel_name'], record['message_id'], len(record['detections'])))
+                model_version = model_version or record['model_version']
+                valid_bytes += len(line)
+        with open(shard_path, 'r+b') as f:
+            f.truncate(valid_bytes)
+        _write_index(shard_path, _summarize(entries, shard_path, model_version))
+        logging.warning(f"Sealed {shard_path} with {len(entries)} records, left unindexed by an interrupted run.")
+        sealed += 1
+    return sealed
@@ -1,9 +1,20 @@
 
 import os
 import json
+import time
+import shutil
+import hashlib
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from ultralytics import YOLO
 from PIL import Image
 import logging
+from enrichment.processed_index import ProcessedIndex
+from enrichment.phash_cache import PhashCache, perceptual_hash, normalize_detections, denormalize_detections
+from enrichment.detection_shards import DetectionShardWriter, seal_orphaned_shards
+from scraping.image_store import IMAGE_STORE_PATH, REFERENCES_FILE, stored_image_path
 
 # --- Configuration ---
 # Configure logging to provide informative output. This helps in tracking the
@@ -18,62 +29,205 @@ logging.basicConfig(
 # for configurability, but we provide default values for ease of use.
 RAW_IMAGES_DIR = os.getenv('RAW_IMAGES_DIR', 'data/raw/images')
 PROCESSED_RESULTS_DIR = os.getenv('PROCESSED_RESULTS_DIR', 'data/processed/image_detections')
-PROCESSED_LOG_FILE = os.path.join(PROCESSED_RESULTS_DIR, 'processed_log.json')
+PROCESSED_INDEX_FILE = os.path.join(PROCESSED_RESULTS_DIR, 'processed_index.sqlite')
+# Detections are appended to newline-delimited shards, one per run and process, each with an index file
+DETECTION_SHARDS_DIR = os.path.join(PROCESSED_RESULTS_DIR, 'shards')
+PROCESSED_LOG_FILE = os.path.join(PROCESSED_RESULTS_DIR, 'processed_log.json') # Replaced by the index, migrated on the first run
+
+# The scraper stores each unique photo once in a content-addressed store and
+# lists the messages that use it in 'refs.jsonl'. Detections are computed once
+# per stored image and cached under 'by_image/' with the model version that
+# produced them, then written for every message.
+# Its location, IMAGE_STORE_PATH, is defined once next to the scraper's ImageStore.
+IMAGE_REFS_FILE = os.path.join(IMAGE_STORE_PATH, REFERENCES_FILE)
+IMAGE_DETECTIONS_CACHE_DIR = os.path.join(PROCESSED_RESULTS_DIR, 'by_image')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+# --- Inference Batching ---
+# Images passed to the model in one call. Larger batches make better use of vectorized CPU
+# kernels; 1 runs the model once per image.
+INFERENCE_BATCH_SIZE = int(os.getenv('INFERENCE_BATCH_SIZE', 8))
+
+# --- Prefetching ---
+# While a batch is being inferred, a pool of threads reads, decodes and letterbox-resizes the
+# next images, up to PREFETCH_DEPTH batches ahead. 0 workers prepares images on the main thread.
+INFERENCE_IMAGE_SIZE = int(os.getenv('INFERENCE_IMAGE_SIZE', 640)) # Side of the square model input
+PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', 2))
+PREFETCH_DEPTH = int(os.getenv('PREFETCH_DEPTH', 2))
+LETTERBOX_COLOR = (114, 114, 114) # The padding color YOLO is trained with
+
+# --- Near-Duplicate Cache ---
+# Reposted product shots are often recompressed or resized copies. Images whose perceptual hash
+# is within PHASH_MAX_DISTANCE bits of an already processed image reuse its detections.
+PHASH_CACHE_ENABLED = os.getenv('PHASH_CACHE', '1') == '1'
+PHASH_MAX_DISTANCE = int(os.getenv('PHASH_MAX_DISTANCE', 4))
+PHASH_CACHE_FILE = os.path.join(PROCESSED_RESULTS_DIR, 'phash_cache.sqlite')
+
+# --- Parallel Workers ---
+# With ENRICH_WORKERS > 1, pending images are split into shards processed by separate
+# processes, each loading its own model. Every worker caps its intra-op threads so the
+# workers together do not oversubscribe the CPU.
+ENRICH_WORKERS = int(os.getenv('ENRICH_WORKERS', 1))
+ENRICH_THREADS_PER_WORKER = int(os.getenv('ENRICH_THREADS_PER_WORKER', 0)) # 0 divides the CPU cores between the workers
 
 # --- Model Loading ---
-# Load the pre-trained YOLOv8 model. 'yolov8n.pt' is a small and fast model,
-# ideal for getting started with general object detection.
-try:
-    model = YOLO('yolov8n.pt')
-    logging.info("YOLOv8 model loaded successfully.")
-except Exception as e:
-    logging.error(f"Fatal: Error loading YOLOv8 model: {e}")
-    # If the model can't be loaded, the script cannot function.
-    exit()
-
-def load_processed_images():
-    """
-    Loads the set of already processed image file paths from a log file.
-    This is a crucial step to avoid re-processing images every time the
-    script runs, making the pipeline efficient.
+# The pre-trained YOLOv8 model is loaded on first use, so importing this module is cheap.
+# 'yolov8n.pt' is a small and fast model, ideal for getting started with general object detection.
+MODEL_PATH = os.getenv('YOLO_MODEL_PATH', 'yolov8n.pt')
+MODEL_VERSION = os.getenv('MODEL_VERSION') # Defaults to the weights file name plus a hash of its content
+
+# --- Inference Backends ---
+# 'torch' runs the weights directly. The other backends export the model once to a
+# CPU-optimized runtime and cache the artifact under EXPORTED_MODELS_DIR, keyed by the
+# weights hash and input size, so later runs (and every worker) load it straight away.
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'torch')
+EXPORTED_MODELS_DIR = os.getenv('EXPORTED_MODELS_DIR', 'models/exported')
+EXPORT_FORMATS = { # Backend -> suffix of the artifact Ultralytics writes
+    'onnx': '.onnx',
+    'openvino': '_openvino_model',
+    'torchscript': '.torchscript',
+}
+BACKENDS = ('torch', *EXPORT_FORMATS)
+_backend = INFERENCE_BACKEND
+_models = {}
+_model_versions = {}
+
+def select_backend(backend: str):
+    """Sets the backend used when none is passed explicitly."""
+    global _backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'. Choose one of: {', '.join(BACKENDS)}.")
+    _backend = backend
+
+def export_model(backend: str):
     """
-    try:
-        if os.path.exists(PROCESSED_LOG_FILE):
-            with open(PROCESSED_LOG_FILE, 'r') as f:
-                return set(json.load(f))
-    except (IOError, json.JSONDecodeError) as e:
-        logging.warning(f"Could not read or parse the processed log file. Starting fresh. Error: {e}")
-    return set()
+    Exports the weights at MODEL_PATH for a backend, unless an artifact for the
+    same weights and input size is already cached.
 
-def save_processed_images(processed_set):
+    Returns:
+        str: The path of the exported model.
     """
-    Saves the updated set of processed image file paths to the log file.
-    This maintains the state of our processing pipeline.
+    source = YOLO(MODEL_PATH) # Ultralytics downloads the official weights if they are missing
+    stem = os.path.splitext(os.path.basename(MODEL_PATH))[0]
+    artifact_path = os.path.join(
+        EXPORTED_MODELS_DIR, f"{stem}-{file_sha256(MODEL_PATH)[:12]}-{INFERENCE_IMAGE_SIZE}{EXPORT_FORMATS[backend]}"
+    )
+    if os.path.exists(artifact_path):
+        return artifact_path
+
+    logging.info(f"Exporting {MODEL_PATH} to {backend}. This only happens once per model.")
+    # A dynamic batch dimension lets the exported model take batches of any size
+    exported_path = source.export(format=backend, imgsz=INFERENCE_IMAGE_SIZE, dynamic=True)
+    os.makedirs(EXPORTED_MODELS_DIR, exist_ok=True)
+    shutil.move(exported_path, artifact_path)
+    logging.info(f"Cached the {backend} model at {artifact_path}.")
+    return artifact_path
+
+def get_model(backend: str = None):
+    """Returns the YOLO model for a backend, loading it on the first call in this process."""
+    backend = backend or _backend
+    if backend not in _models:
+        try:
+            if backend == 'torch':
+                _models[backend] = YOLO(MODEL_PATH)
+            else:
+                _models[backend] = YOLO(export_model(backend), task='detect')
+            logging.info(f"YOLOv8 model loaded successfully ({backend} backend).")
+        except Exception as e:
+            logging.error(f"Fatal: Error loading YOLOv8 model: {e}")
+            # If the model can't be loaded, the script cannot function.
+            raise
+    return _models[backend]
+
+def file_sha256(file_path):
+    """Returns the SHA-256 hash of a file, read in 1 MB chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_model_version(backend: str = None):
     """
-    try:
-        # Ensure the directory exists before saving the file.
-        os.makedirs(PROCESSED_RESULTS_DIR, exist_ok=True)
-        with open(PROCESSED_LOG_FILE, 'w') as f:
-            json.dump(list(processed_set), f, indent=4)
-    except IOError as e:
-        logging.error(f"Could not write to the processed log file: {e}")
+    Identifies the model that produced detections, so results can be tied to it.
+    Backends other than 'torch' are appended, as their outputs can differ slightly.
+    """
+    backend = backend or _backend
+    if backend not in _model_versions:
+        if MODEL_VERSION:
+            version = MODEL_VERSION
+        else:
+            if not os.path.exists(MODEL_PATH):
+                get_model('torch') # Ultralytics downloads the official weights on first load
+            if os.path.exists(MODEL_PATH):
+                version = f"{os.path.basename(MODEL_PATH)}:{file_sha256(MODEL_PATH)[:12]}"
+            else:
+                version = os.path.basename(MODEL_PATH)
+        _model_versions[backend] = version if backend == 'torch' else f"{version}+{backend}"
+    return _model_versions[backend]
 
-def process_new_images():
+def open_processed_index():
     """
-    This is the main function. It recursively scans the image directory,
-    identifies new images that haven't been processed, runs the YOLO model
-    on them, and saves the detection results.
+    Opens the index of processed images, importing the old
+    `processed_log.json` the first time.
     """
-    logging.info("Starting image processing run...")
-    processed_images = load_processed_images()
-    new_images_processed_count = 0
+    index = ProcessedIndex(PROCESSED_INDEX_FILE)
+    index.migrate_json_log(PROCESSED_LOG_FILE)
+    return index
 
-    if not os.path.exists(RAW_IMAGES_DIR):
-        logging.error(f"Input directory not found: {RAW_IMAGES_DIR}. Please check the path.")
-        return
+def load_image_references():
+    """
+    Reads the image store's reference log and groups the messages by image.
+
+    Returns:
+        dict: Content hash -> list of unique (channel_name, message_id) pairs.
+    """
+    references = {}
+    if not os.path.exists(IMAGE_REFS_FILE):
+        return references
+    with open(IMAGE_REFS_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                ref = json.loads(line)
+            except json.JSONDecodeError:
+                continue # A partially written last line from an interrupted scrape
+            targets = references.setdefault(ref['photo_sha256'], [])
+            target = (ref['channel_name'], ref['message_id'])
+            if target not in targets:
+                targets.append(target)
+    return references
+
+def find_pending_images(processed_images):
+    """
+    Lists the images that still have messages without detections.
+
+    Each work item holds the image path and the messages ('targets') to write
+    detections for. Stored images are listed once no matter how many posts use
+    them. Images in the older '<date>/<channel>/' layout are still picked up,
+    with the message_id taken from the filename.
+
+    Returns:
+        list: Work items with 'key', 'path', 'sha256' and 'targets'.
+    """
+    pending = []
+
+    # 1. Unique images from the content-addressed store
+    for sha256, references in load_image_references().items():
+        full_image_path = stored_image_path(sha256)
+        relative_path = os.path.relpath(full_image_path, RAW_IMAGES_DIR)
+        targets = [
+            {'key': f"{relative_path}#{channel_name}/{message_id}", 'channel_name': channel_name, 'message_id': message_id}
+            for channel_name, message_id in references
+        ]
+        targets = [target for target in targets if target['key'] not in processed_images]
+        if targets and os.path.exists(full_image_path):
+            pending.append({'key': relative_path, 'path': full_image_path, 'sha256': sha256, 'targets': targets})
 
-    # Use os.walk() to recursively scan through the directory tree.
+    # 2. Images in the legacy per-date, per-channel folders
     for root, dirs, files in os.walk(RAW_IMAGES_DIR):
+        # The store is handled above through its reference log
+        dirs[:] = [name for name in dirs if os.path.abspath(os.path.join(root, name)) != os.path.abspath(IMAGE_STORE_PATH)]
+
         for image_filename in files:
             full_image_path = os.path.join(root, image_filename)
             relative_path = os.path.relpath(full_image_path, RAW_IMAGES_DIR)
@@ -81,7 +235,7 @@ def process_new_images():
             if relative_path in processed_images:
                 continue
 
-            if not image_filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
+            if not image_filename.lower().endswith(IMAGE_EXTENSIONS):
                 continue
 
             # The message_id is derived from the image filename (e.g., "12345.jpg")
@@ -95,42 +249,419 @@ def process_new_images():
                 logging.warning(f"Could not determine message_id from filename '{image_filename}'. Skipping file.")
                 continue
 
-            try:
-                # Use Pillow to open the image; this also helps validate that it's a proper image file.
-                with Image.open(full_image_path) as img:
-                    # Perform object detection on the image.
-                    results = model(img)
-
-                detections = []
-                for result in results:
-                    for box in result.boxes:
-                        detections.append({
-                            'message_id': message_id,
-                            'detected_object_class': model.names[int(box.cls)],
-                            'confidence_score': float(box.conf),
-                            'bounding_box': box.xyxy.tolist()[0] # [x1, y1, x2, y2]
-                        })
-
-                if detections:
-                    output_filename = f'{message_id}.json'
-                    output_path = os.path.join(PROCESSED_RESULTS_DIR, output_filename)
-                    with open(output_path, 'w') as f:
-                        json.dump(detections, f, indent=4)
-                    logging.info(f"Saved {len(detections)} detections for image '{relative_path}'")
-
-                # Mark this image's relative path as processed.
-                processed_images.add(relative_path)
-                new_images_processed_count += 1
-
-            except Exception as e:
-                logging.error(f"Failed to process image '{full_image_path}': {e}")
+            # The channel is the folder name in the '<date>/<channel>/' layout
+            folders = os.path.relpath(root, RAW_IMAGES_DIR).split(os.sep)
+            channel_name = folders[1] if len(folders) == 2 else None
+
+            pending.append({
+                'key': relative_path,
+                'path': full_image_path,
+                'sha256': None,
+                'targets': [{'key': relative_path, 'channel_name': channel_name, 'message_id': message_id}],
+            })
+
+    return pending
+
+def prepare_image(image_path, image_size: int = INFERENCE_IMAGE_SIZE):
+    """
+    Reads, decodes and letterbox-resizes one image for the model: the image is
+    scaled to fit a square of `image_size` pixels, keeping its aspect ratio,
+    and centered on a gray canvas.
+
+    Returns:
+        dict: The model input ('image'), plus the 'scale' and 'pad' needed to
+            map boxes back, the original 'size' of the image and its perceptual hash ('phash').
+    """
+    # Use Pillow to open the image; this also helps validate that it's a proper image file.
+    with Image.open(image_path) as img:
+        img = img.convert('RGB')
+
+    width, height = img.size
+    scale = min(image_size / width, image_size / height)
+    resized_width, resized_height = max(1, round(width * scale)), max(1, round(height * scale))
+    pad_x, pad_y = (image_size - resized_width) // 2, (image_size - resized_height) // 2
+
+    canvas = Image.new('RGB', (image_size, image_size), LETTERBOX_COLOR)
+    canvas.paste(img.resize((resized_width, resized_height), Image.BILINEAR), (pad_x, pad_y))
+    return {
+        'image': canvas, 'scale': scale, 'pad': (pad_x, pad_y), 'size': (width, height),
+        'phash': perceptual_hash(img) if PHASH_CACHE_ENABLED else None,
+    }
+
+def _to_original_box(box, prepared):
+    """Maps [x1, y1, x2, y2] from the letterboxed model input back to the original image."""
+    pad_x, pad_y = prepared['pad']
+    width, height = prepared['size']
+    x1, y1, x2, y2 = box
+    return [
+        min(max((x1 - pad_x) / prepared['scale'], 0.0), width),
+        min(max((y1 - pad_y) / prepared['scale'], 0.0), height),
+        min(max((x2 - pad_x) / prepared['scale'], 0.0), width),
+        min(max((y2 - pad_y) / prepared['scale'], 0.0), height),
+    ]
+
+def _result_detections(result, prepared, class_names):
+    """Converts the boxes of one YOLO result into detection dictionaries in original image coordinates."""
+    detections = []
+    for box in result.boxes:
+        detections.append({
+            'detected_object_class': class_names[int(box.cls)],
+            'confidence_score': float(box.conf),
+            'bounding_box': _to_original_box(box.xyxy.tolist()[0], prepared) # [x1, y1, x2, y2]
+        })
+    return detections
+
+def detect_prepared_batch(prepared_images, backend: str = None):
+    """
+    Runs the YOLO model once on a batch of images returned by `prepare_image`.
+
+    Args:
+        backend (str, optional): The inference backend. Defaults to the selected one.
+
+    Returns:
+        list: One list of detections per image, in input order.
+    """
+    model = get_model(backend)
+    # Perform object detection on all images in a single call.
+    results = model([prepared['image'] for prepared in prepared_images], imgsz=INFERENCE_IMAGE_SIZE)
+    return [_result_detections(result, prepared, model.names) for result, prepared in zip(results, prepared_images)]
+
+def detect_objects_batch(image_paths, backend: str = None):
+    """
+    Runs the YOLO model once on a batch of image files.
+
+    Returns:
+        list: One list of detections per image, in the order of `image_paths`.
+    """
+    return detect_prepared_batch([prepare_image(image_path) for image_path in image_paths], backend)
+
+def detect_objects(image_path):
+    """
+    Runs the YOLO model on one image.
+
+    Returns:
+        list: Detections with class, confidence score and bounding box.
+    """
+    return detect_objects_batch([image_path])[0]
+
+def _prepare_or_error(image_path):
+    """Prepares an image, returning the exception instead of raising it so one bad file does not stop a batch."""
+    try:
+        return prepare_image(image_path)
+    except Exception as e:
+        return e
+
+def iter_prefetched_batches(items, batch_size: int = INFERENCE_BATCH_SIZE, workers: int = PREFETCH_WORKERS,
+                            depth: int = PREFETCH_DEPTH):
+    """
+    Yields (items, prepared) batches, where `prepared` holds the result of
+    `prepare_image` (or the exception it raised) for each item.
+
+    With workers > 0, a thread pool prepares upcoming images while the caller
+    runs inference on the current batch. At most `depth` batches are prepared
+    ahead, which bounds the decoded images held in memory.
+    """
+    batches = [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+    if workers <= 0:
+        for batch in batches:
+            yield batch, [_prepare_or_error(item['path']) for item in batch]
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        queued = deque()
+        for batch in batches:
+            queued.append((batch, [pool.submit(_prepare_or_error, item['path']) for item in batch]))
+            if len(queued) > depth:
+                queued_batch, futures = queued.popleft()
+                yield queued_batch, [future.result() for future in futures]
+        while queued:
+            queued_batch, futures = queued.popleft()
+            yield queued_batch, [future.result() for future in futures]
+
+def _cache_path(item):
+    return os.path.join(IMAGE_DETECTIONS_CACHE_DIR, f"{item['sha256']}.json")
+
+def read_cached_detections(item):
+    """
+    Returns the cached detections of a stored image, or None if it has not been
+    processed before by the current model version.
+    """
+    if not item['sha256'] or not os.path.exists(_cache_path(item)):
+        return None
+    with open(_cache_path(item), 'r') as f:
+        entry = json.load(f)
+    # Entries of other model versions (and older entries holding a bare list) are computed again
+    if not isinstance(entry, dict) or entry.get('model_version') != get_model_version():
+        return None
+    return entry['detections']
+
+def cache_detections(item, detections):
+    """Caches the detections of a stored image by content hash, together with the model version."""
+    if not item['sha256']:
+        return
+    os.makedirs(IMAGE_DETECTIONS_CACHE_DIR, exist_ok=True)
+    with open(_cache_path(item), 'w') as f:
+        json.dump({'model_version': get_model_version(), 'detections': detections}, f)
+
+def _finish_item(item, detections, processed_index, shard_writer):
+    """Saves an image's detections for all of its messages and records them as processed right away."""
+    content_hash = item['sha256'] or file_sha256(item['path'])
+    for target in item['targets']:
+        shard_writer.write(target['channel_name'], target['message_id'], detections, item['key'], content_hash)
+    if detections:
+        logging.info(f"Saved {len(detections)} detections for image '{item['key']}' ({len(item['targets'])} message(s))")
+
+    # Mark each message of this image as processed.
+    processed_index.add_many([
+        (target['key'], item['path'], content_hash, get_model_version()) for target in item['targets']
+    ])
+
+def run_inference_batch(items, prepared_images, processed_index, shard_writer, phash_cache: PhashCache = None):
+    """
+    Runs the model once on a batch of prepared work items and saves the results,
+    also adding them to the pHash cache when one is given.
+    If the batch fails, its images are retried one by one so a single bad
+    file does not lose the whole batch.
+
+    Returns:
+        int: The number of images processed.
+    """
+    started = time.perf_counter()
+    try:
+        batch_detections = detect_prepared_batch(prepared_images)
+    except Exception as e:
+        if len(items) == 1:
+            logging.error(f"Failed to process image '{items[0]['path']}': {e}")
+            return 0
+        logging.warning(f"Batch of {len(items)} images failed ({e}). Retrying them one at a time.")
+        return sum(
+            run_inference_batch([item], [prepared], processed_index, shard_writer, phash_cache)
+            for item, prepared in zip(items, prepared_images)
+        )
+
+    seconds = time.perf_counter() - started
+    logging.info(f"Inferred a batch of {len(items)} image(s) in {seconds:.2f} seconds ({len(items) / max(seconds, 1e-9):.1f} images/s).")
+
+    for item, prepared, detections in zip(items, prepared_images, batch_detections):
+        cache_detections(item, detections)
+        if phash_cache:
+            phash_cache.store(prepared['phash'], normalize_detections(detections, prepared['size']))
+        _finish_item(item, detections, processed_index, shard_writer)
+    return len(items)
+
+def infer_items(items, batch_size: int = INFERENCE_BATCH_SIZE, prefetch_workers: int = PREFETCH_WORKERS,
+                prefetch_depth: int = PREFETCH_DEPTH, processed_index: ProcessedIndex = None,
+                shard_writer: DetectionShardWriter = None):
+    """
+    Runs the model over work items in batches, with images prepared ahead by
+    the prefetch threads, and saves the detections of every item.
+
+    Images within PHASH_MAX_DISTANCE bits of a cached image reuse its
+    detections instead of being inferred.
+
+    Args:
+        processed_index (ProcessedIndex, optional): Where finished images are recorded.
+            Worker processes leave it out and open their own connection.
+        shard_writer (DetectionShardWriter, optional): Where detections are written.
+            Worker processes leave it out and write their own shard.
+
+    Returns:
+        dict: 'processed' images, and the pHash cache 'lookups' and 'hits'.
+    """
+    processed_index = processed_index or ProcessedIndex(PROCESSED_INDEX_FILE)
+    own_shard_writer = shard_writer is None
+    shard_writer = shard_writer or DetectionShardWriter(DETECTION_SHARDS_DIR, get_model_version())
+    phash_cache = PhashCache(PHASH_CACHE_FILE, get_model_version(), PHASH_MAX_DISTANCE) if PHASH_CACHE_ENABLED else None
+    processed_count = 0
+    # Images are decoded and resized in the background while the previous batch is inferred
+    for batch, prepared_images in iter_prefetched_batches(items, batch_size, prefetch_workers, prefetch_depth):
+        ready = []
+        for item, prepared in zip(batch, prepared_images):
+            if isinstance(prepared, Exception):
+                logging.error(f"Failed to process image '{item['path']}': {prepared}")
+                continue
+            cached = phash_cache.lookup(prepared['phash']) if phash_cache else None
+            if cached is None:
+                ready.append((item, prepared))
+                continue
+            # A near-duplicate was processed before: reuse its detections at this image's size
+            detections = denormalize_detections(cached, prepared['size'])
+            cache_detections(item, detections)
+            _finish_item(item, detections, processed_index, shard_writer)
+            processed_count += 1
+        if ready:
+            processed_count += run_inference_batch(
+                [item for item, _ in ready], [prepared for _, prepared in ready], processed_index, shard_writer, phash_cache
+            )
+    if own_shard_writer:
+        shard_writer.close()
+
+    stats = {'processed': processed_count, 'lookups': 0, 'hits': 0}
+    if phash_cache:
+        stats.update(lookups=phash_cache.lookups, hits=phash_cache.hits)
+        phash_cache.close()
+    return stats
+
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+def limit_runtime_threads(threads: int):
+    """
+    Caps the intra-op threads of every inference runtime in this process. Must
+    run before the model is loaded. Ultralytics creates the ONNX Runtime session
+    and the OpenVINO core itself, so both are wrapped to apply the limit.
+    """
+    import torch
+    torch.set_num_threads(threads)
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+
+    try:
+        import onnxruntime
+    except ImportError:
+        onnxruntime = None
+    if onnxruntime is not None:
+        class ThreadLimitedSession(onnxruntime.InferenceSession):
+            def __init__(self, path_or_bytes, sess_options=None, *args, **kwargs):
+                sess_options = sess_options or onnxruntime.SessionOptions()
+                sess_options.intra_op_num_threads = threads
+                sess_options.inter_op_num_threads = 1
+                super().__init__(path_or_bytes, sess_options, *args, **kwargs)
+        onnxruntime.InferenceSession = ThreadLimitedSession
+
+    try:
+        import openvino
+    except ImportError:
+        openvino = None
+    if openvino is not None:
+        class ThreadLimitedCore(openvino.Core):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.set_property('CPU', {'INFERENCE_NUM_THREADS': threads})
+        openvino.Core = ThreadLimitedCore
+
+def _init_worker(threads: int, backend: str):
+    """Caps the intra-op threads of a worker process and selects its backend before its model is loaded."""
+    limit_runtime_threads(threads)
+    select_backend(backend)
+
+def infer_items_sharded(items, workers: int, threads_per_worker: int = ENRICH_THREADS_PER_WORKER, **infer_kwargs):
+    """
+    Splits work items round-robin into `workers` shards and runs `infer_items`
+    on each shard in its own process. Each process loads the model once.
+
+    Every worker records its finished images in the shared processed index
+    (SQLite in WAL mode handles the concurrent writers). A failed shard is
+    logged and does not discard the results of the others.
+
+    Returns:
+        dict: 'processed' images, and the pHash cache 'lookups' and 'hits', summed over the workers.
+    """
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    shards = [items[index::workers] for index in range(workers)]
+    logging.info(f"Processing {len(items)} image(s) in {workers} worker processes with {threads} thread(s) each.")
+
+    stats = {'processed': 0, 'lookups': 0, 'hits': 0}
+    # OpenMP reads its thread count when the library loads, i.e. on import in the spawned
+    # worker, so the limit is passed through the environment the workers inherit
+    saved_env = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+    os.environ.update({name: str(threads) for name in THREAD_ENV_VARS})
+    try:
+        # 'spawn' gives every worker a clean interpreter, as forking a process that uses torch threads can deadlock
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(threads, _backend)) as pool:
+            futures = [pool.submit(infer_items, shard, **infer_kwargs) for shard in shards if shard]
+            for future in futures:
+                try:
+                    shard_stats = future.result()
+                except Exception as e:
+                    logging.error(f"An enrichment worker failed: {e}")
+                    continue
+                for name in stats:
+                    stats[name] += shard_stats[name]
+    finally:
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return stats
+
+def process_new_images(batch_size: int = INFERENCE_BATCH_SIZE, prefetch_workers: int = PREFETCH_WORKERS,
+                       prefetch_depth: int = PREFETCH_DEPTH, workers: int = ENRICH_WORKERS):
+    """
+    This is the main function. It finds images that still have messages
+    without detections, runs the YOLO model once per unique image, and saves
+    the detection results for every message that uses the image.
+
+    Images whose detections are already cached are finished right away; the
+    others are passed to the model `batch_size` at a time, while
+    `prefetch_workers` threads prepare up to `prefetch_depth` batches ahead.
+    With workers > 1 the images are split across that many processes.
+
+    Returns:
+        int: The number of images processed.
+    """
+    logging.info("Starting image processing run...")
+    new_images_processed_count = 0
+
+    if not os.path.exists(RAW_IMAGES_DIR):
+        logging.error(f"Input directory not found: {RAW_IMAGES_DIR}. Please check the path.")
+        return 0
+
+    os.makedirs(PROCESSED_RESULTS_DIR, exist_ok=True)
+    seal_orphaned_shards(DETECTION_SHARDS_DIR)
+    processed_images = open_processed_index()
+    shard_writer = DetectionShardWriter(DETECTION_SHARDS_DIR, get_model_version())
+    started = time.perf_counter()
+    to_infer = []
+    for item in find_pending_images(processed_images):
+        try:
+            detections = read_cached_detections(item)
+        except Exception as e:
+            logging.error(f"Failed to process image '{item['path']}': {e}")
+            continue
+        if detections is None:
+            to_infer.append(item)
+        else:
+            _finish_item(item, detections, processed_images, shard_writer)
+            new_images_processed_count += 1
+
+    if to_infer and _backend != 'torch' and _backend not in _models:
+        export_model(_backend) # Export once here instead of racing in every worker
+    infer_kwargs = {'batch_size': batch_size, 'prefetch_workers': prefetch_workers, 'prefetch_depth': prefetch_depth}
+    if workers > 1 and len(to_infer) > 1:
+        stats = infer_items_sharded(to_infer, min(workers, len(to_infer)), **infer_kwargs)
+    else:
+        stats = infer_items(to_infer, processed_index=processed_images, shard_writer=shard_writer, **infer_kwargs)
+    shard_writer.close()
+    processed_images.close()
+    new_images_processed_count += stats['processed']
+    if stats['lookups']:
+        logging.info(
+            f"pHash cache: {stats['hits']} of {stats['lookups']} image(s) reused earlier detections "
+            f"({stats['hits'] / stats['lookups']:.0%} hit rate)."
+        )
 
     if new_images_processed_count > 0:
-        save_processed_images(processed_images)
-        logging.info(f"Processing complete. Processed {new_images_processed_count} new image(s).")
+        seconds = time.perf_counter() - started
+        logging.info(
+            f"Processing complete. Processed {new_images_processed_count} new image(s) in {seconds:.1f} seconds "
+            f"({new_images_processed_count / max(seconds, 1e-9):.1f} images/s, batch_size={batch_size})."
+        )
     else:
         logging.info("No new images found to process.")
+    return new_images_processed_count
 
 
 if __name__ == '__main__':
-    process_new_images()
+    parser = argparse.ArgumentParser(description="Run YOLOv8 object detection on newly scraped images.")
+    parser.add_argument('--batch-size', type=int, default=INFERENCE_BATCH_SIZE, help="Images per model call.")
+    parser.add_argument('--prefetch-workers', type=int, default=PREFETCH_WORKERS, help="Threads preparing images ahead of inference.")
+    parser.add_argument('--prefetch-depth', type=int, default=PREFETCH_DEPTH, help="Batches prepared ahead of inference.")
+    parser.add_argument('--workers', type=int, default=ENRICH_WORKERS, help="Worker processes, each with its own model.")
+    parser.add_argument('--backend', choices=BACKENDS, default=INFERENCE_BACKEND, help="Inference backend.")
+    args = parser.parse_args()
+
+    select_backend(args.backend)
+    process_new_images(batch_size=args.batch_size, prefetch_workers=args.prefetch_workers, prefetch_depth=args.prefetch_depth,
+                       workers=args.workers)
@@ -0,0 +1,191 @@
+# This script runs the enrichment stage as a long-lived worker that keeps the YOLO model loaded
+# and processes jobs from the local queue, so a new batch of images is enriched within seconds.
+#
+# Usage:
+#   PYTHONPATH=src python -m enrichment.enrichment_worker --backend onnx
+#   curl http://127.0.0.1:8765/health
+#   curl http://127.0.0.1:8765/stats
+
+import os
+import json
+import time
+import signal
+import argparse
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from enrichment import enrich_images
+from enrichment.job_queue import JobQueue, ENRICHMENT_QUEUE_FILE, WORKER_STATUS_FILE, WORKER_STALE_SECONDS
+
+# --- Worker Settings ---
+WORKER_POLL_SECONDS = float(os.getenv('ENRICHMENT_WORKER_POLL_SECONDS', 1.0)) # How often an idle worker checks the queue
+WORKER_HEARTBEAT_SECONDS = float(os.getenv('ENRICHMENT_WORKER_HEARTBEAT_SECONDS', 5.0)) # How often the status file is rewritten
+WORKER_HTTP_HOST = os.getenv('ENRICHMENT_WORKER_HTTP_HOST', '127.0.0.1')
+WORKER_HTTP_PORT = int(os.getenv('ENRICHMENT_WORKER_HTTP_PORT', 8765)) # 0 disables the HTTP endpoints
+
+
+class WorkerStats:
+    """Health and throughput counters of the worker, shared with the HTTP thread."""
+
+    def __init__(self, backend: str, model_version: str):
+        self._lock = threading.Lock()
+        self._values = {
+            'pid': os.getpid(),
+            'backend': backend,
+            'model_version': model_version,
+            'started_at': time.time(),
+            'heartbeat': time.time(),
+            'state': 'idle',
+            'current_job': None,
+            'jobs_done': 0,
+            'jobs_failed': 0,
+            'images_processed': 0,
+            'busy_seconds': 0.0,
+            'last_job': None,
+            'queue': {},
+        }
+
+    def update(self, **values):
+        with self._lock:
+            self._values.update(values)
+
+    def job_finished(self, job_id: int, processed: int, seconds: float, error: str = None):
+        """Adds a finished job to the counters."""
+        with self._lock:
+            self._values['jobs_failed' if error else 'jobs_done'] += 1
+            self._values['images_processed'] += processed
+            self._values['busy_seconds'] += seconds
+            self._values['last_job'] = {
+                'id': job_id,
+                'processed': processed,
+                'seconds': round(seconds, 3),
+                'images_per_second': round(processed / max(seconds, 1e-9), 2),
+                'error': error,
+            }
+
+    def snapshot(self):
+        """Returns a copy of the counters with derived uptime and throughput."""
+        with self._lock:
+            values = dict(self._values)
+        values['uptime_seconds'] = round(time.time() - values['started_at'], 1)
+        values['images_per_busy_second'] = round(values['images_processed'] / max(values['busy_seconds'], 1e-9), 2)
+        return values
+
+def write_status_file(stats: WorkerStats, path: str = WORKER_STATUS_FILE):
+    """Writes the stats to the status file atomically, so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(stats.snapshot(), f, indent=4)
+    os.replace(temp_path, path)
+
+def _write_heartbeats(stats: WorkerStats, stopping: threading.Event, interval: float):
+    """Refreshes the heartbeat and status file until the worker stops, also while a long job runs."""
+    while not stopping.is_set():
+        stats.update(heartbeat=time.time())
+        write_status_file(stats)
+        stopping.wait(interval)
+
+def start_http_server(stats: WorkerStats, host: str = WORKER_HTTP_HOST, port: int = WORKER_HTTP_PORT):
+    """
+    Serves GET /health (200 while the worker loop is alive, 503 otherwise)
+    and GET /stats on a background thread.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            snapshot = stats.snapshot()
+            if self.path == '/health':
+                healthy = time.time() - snapshot['heartbeat'] < WORKER_STALE_SECONDS
+                code, body = (200 if healthy else 503), {'status': 'ok' if healthy else 'stale', 'state': snapshot['state']}
+            elif self.path == '/stats':
+                code, body = 200, snapshot
+            else:
+                code, body = 404, {'error': 'not found'}
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass # Keep health checks out of the worker log
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Worker health and stats available at http://{host}:{port}/health and /stats.")
+    return server
+
+def run_worker(queue_path: str = ENRICHMENT_QUEUE_FILE, poll_seconds: float = WORKER_POLL_SECONDS,
+               http_port: int = WORKER_HTTP_PORT, **process_kwargs):
+    """
+    Loads the model once and processes queued jobs until SIGINT or SIGTERM.
+    A job that is running when the worker stops is finished first.
+
+    Args:
+        queue_path (str): The SQLite job queue.
+        poll_seconds (float): Delay between queue checks while idle.
+        http_port (int): Port of the health and stats endpoints; 0 disables them.
+        **process_kwargs: Passed on to `enrich_images.process_new_images`.
+    """
+    stopping = threading.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: stopping.set())
+
+    # Pay for the ultralytics import and the model load once, before the first job
+    enrich_images.get_model()
+    stats = WorkerStats(enrich_images._backend, enrich_images.get_model_version())
+
+    queue = JobQueue(queue_path)
+    requeued = queue.requeue_running()
+    if requeued:
+        logging.warning(f"Requeued {requeued} job(s) left running by a previous worker.")
+    heartbeat = threading.Thread(target=_write_heartbeats, args=(stats, stopping, WORKER_HEARTBEAT_SECONDS), daemon=True)
+    heartbeat.start()
+    server = start_http_server(stats, port=http_port) if http_port else None
+    logging.info(f"Enrichment worker ready. Waiting for jobs in {queue_path}.")
+
+    try:
+        while not stopping.is_set():
+            job_id = queue.claim()
+            stats.update(queue=queue.counts())
+            if job_id is None:
+                stopping.wait(poll_seconds)
+                continue
+
+            logging.info(f"Starting enrichment job {job_id}.")
+            stats.update(state='busy', current_job=job_id)
+            started = time.perf_counter()
+            processed, error = 0, None
+            try:
+                processed = enrich_images.process_new_images(workers=1, **process_kwargs)
+            except Exception as e:
+                error = str(e)
+                logging.error(f"Enrichment job {job_id} failed: {e}")
+            seconds = time.perf_counter() - started
+            queue.finish(job_id, processed, error)
+            stats.job_finished(job_id, processed, seconds, error)
+            stats.update(state='idle', current_job=None, queue=queue.counts())
+            logging.info(f"Finished enrichment job {job_id}: {processed} image(s) in {seconds:.1f} seconds.")
+    finally:
+        stopping.set()
+        heartbeat.join()
+        stats.update(state='stopped')
+        write_status_file(stats)
+        if server:
+            server.shutdown()
+        queue.close()
+        logging.info("Enrichment worker stopped.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a long-lived enrichment worker that keeps the YOLO model loaded.")
+    parser.add_argument('--queue', default=ENRICHMENT_QUEUE_FILE, help="The SQLite job queue.")
+    parser.add_argument('--poll-seconds', type=float, default=WORKER_POLL_SECONDS, help="Queue check interval while idle.")
+    parser.add_argument('--port', type=int, default=WORKER_HTTP_PORT, help="Port of the health and stats endpoints (0 disables them).")
+    parser.add_argument('--backend', choices=enrich_images.BACKENDS, default=enrich_images.INFERENCE_BACKEND, help="Inference backend.")
+    parser.add_argument('--batch-size', type=int, default=enrich_images.INFERENCE_BATCH_SIZE, help="Images per model call.")
+    args = parser.parse_args()
+
+    enrich_images.select_backend(args.backend)
+    run_worker(queue_path=args.queue, poll_seconds=args.poll_seconds, http_port=args.port, batch_size=args.batch_size)
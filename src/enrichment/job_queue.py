@@ -0,0 +1,165 @@
+# This file contains the local SQLite job queue that feeds the long-running enrichment worker.
+
+import os
+import json
+import time
+import sqlite3
+import argparse
+from datetime import datetime, timezone
+
+ENRICHMENT_QUEUE_FILE = os.getenv('ENRICHMENT_QUEUE_FILE', 'data/processed/enrichment_queue.sqlite')
+WORKER_STATUS_FILE = os.getenv('ENRICHMENT_WORKER_STATUS_FILE', 'data/processed/enrichment_worker_status.json')
+WORKER_STALE_SECONDS = int(os.getenv('ENRICHMENT_WORKER_STALE_SECONDS', 30)) # A worker without a heartbeat for this long is considered down
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobQueue:
+    """
+    A queue of enrichment jobs in SQLite. Each job asks the worker to process
+    every image that is still pending, so a new job is only added when none is
+    waiting yet; submitting again while one is queued returns that job.
+
+    Job states: 'queued' -> 'running' -> 'done' or 'failed'.
+    """
+
+    def __init__(self, path: str = ENRICHMENT_QUEUE_FILE):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS enrichment_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                status TEXT NOT NULL,
+                source TEXT,
+                submitted_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                processed INTEGER,
+                error TEXT
+            );
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS enrichment_jobs_status ON enrichment_jobs (status, id);")
+
+    def submit(self, source: str = None):
+        """
+        Queues a job unless one is already waiting.
+
+        Returns:
+            int: The id of the queued job.
+        """
+        self._conn.execute("BEGIN IMMEDIATE;")
+        try:
+            row = self._conn.execute("SELECT id FROM enrichment_jobs WHERE status = 'queued' ORDER BY id LIMIT 1;").fetchone()
+            if row:
+                job_id = row['id']
+            else:
+                job_id = self._conn.execute(
+                    "INSERT INTO enrichment_jobs (status, source, submitted_at) VALUES ('queued', ?, ?);", (source, _now())
+                ).lastrowid
+            self._conn.execute("COMMIT;")
+        except Exception:
+            self._conn.execute("ROLLBACK;")
+            raise
+        return job_id
+
+    def claim(self):
+        """
+        Marks the oldest queued job as running.
+
+        Returns:
+            int: The job id, or None if the queue is empty.
+        """
+        self._conn.execute("BEGIN IMMEDIATE;")
+        try:
+            row = self._conn.execute("SELECT id FROM enrichment_jobs WHERE status = 'queued' ORDER BY id LIMIT 1;").fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE enrichment_jobs SET status = 'running', started_at = ? WHERE id = ?;", (_now(), row['id'])
+                )
+            self._conn.execute("COMMIT;")
+        except Exception:
+            self._conn.execute("ROLLBACK;")
+            raise
+        return row['id'] if row else None
+
+    def finish(self, job_id: int, processed: int = 0, error: str = None):
+        """Records the outcome of a job."""
+        self._conn.execute(
+            "UPDATE enrichment_jobs SET status = ?, finished_at = ?, processed = ?, error = ? WHERE id = ?;",
+            ('failed' if error else 'done', _now(), processed, error, job_id)
+        )
+
+    def requeue_running(self):
+        """
+        Puts jobs left 'running' by a worker that stopped back in the queue.
+
+        Returns:
+            int: The number of requeued jobs.
+        """
+        return self._conn.execute(
+            "UPDATE enrichment_jobs SET status = 'queued', started_at = NULL WHERE status = 'running';"
+        ).rowcount
+
+    def get(self, job_id: int):
+        """Returns a job as a dictionary, or None if it does not exist."""
+        row = self._conn.execute("SELECT * FROM enrichment_jobs WHERE id = ?;", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def wait(self, job_id: int, timeout: float = None, poll_seconds: float = 1.0):
+        """
+        Waits until a job is done or failed.
+
+        Returns:
+            dict: The finished job.
+
+        Raises:
+            TimeoutError: If the job has not finished within `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            job = self.get(job_id)
+            if job and job['status'] in ('done', 'failed'):
+                return job
+            if deadline and time.monotonic() > deadline:
+                raise TimeoutError(f"Enrichment job {job_id} did not finish within {timeout} seconds.")
+            time.sleep(poll_seconds)
+
+    def counts(self):
+        """Returns the number of jobs in each state."""
+        rows = self._conn.execute("SELECT status, COUNT(*) AS jobs FROM enrichment_jobs GROUP BY status;").fetchall()
+        return {row['status']: row['jobs'] for row in rows}
+
+    def close(self):
+        self._conn.close()
+
+
+def read_worker_status(path: str = WORKER_STATUS_FILE):
+    """Returns the status the worker last wrote, or None if there is none."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, json.JSONDecodeError):
+        return None
+
+def worker_is_alive(path: str = WORKER_STATUS_FILE, stale_seconds: int = WORKER_STALE_SECONDS):
+    """Returns True if the worker wrote a heartbeat in the last `stale_seconds` seconds."""
+    status = read_worker_status(path)
+    return bool(status) and status.get('state') != 'stopped' and time.time() - status.get('heartbeat', 0) < stale_seconds
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Submit an enrichment job to the worker queue.")
+    parser.add_argument('--queue', default=ENRICHMENT_QUEUE_FILE, help="The SQLite job queue.")
+    parser.add_argument('--wait', action='store_true', help="Wait for the job to finish and print it.")
+    parser.add_argument('--timeout', type=float, default=None, help="Seconds to wait at most.")
+    args = parser.parse_args()
+
+    queue = JobQueue(args.queue)
+    job_id = queue.submit(source='cli')
+    print(json.dumps(queue.wait(job_id, args.timeout) if args.wait else queue.get(job_id), indent=4))
+    queue.close()
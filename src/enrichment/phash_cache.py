@@ -0,0 +1,150 @@
+# This file contains the perceptual-hash cache that lets near-duplicate images reuse earlier detections.
+
+import os
+import json
+import sqlite3
+import logging
+import numpy as np
+from PIL import Image
+
+PHASH_SIZE = 32 # Side of the grayscale thumbnail the DCT is computed on
+PHASH_LOW_FREQUENCIES = 8 # Side of the block of lowest DCT frequencies forming the 64-bit hash
+PHASH_BANDS = 8 # 8-bit bands used for lookups; any hash within 7 bits shares at least one band
+
+_DCT_MATRIX = None
+
+
+def _dct_matrix(size: int):
+    """Returns the orthonormal DCT-II matrix, so `M @ X @ M.T` is the 2D DCT of X."""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+def perceptual_hash(img: Image.Image):
+    """
+    Computes the 64-bit DCT perceptual hash of an image. Recompressed or
+    resized copies of the same picture get hashes that differ in only a few bits.
+
+    Returns:
+        int: The hash as an unsigned 64-bit integer.
+    """
+    global _DCT_MATRIX
+    if _DCT_MATRIX is None:
+        _DCT_MATRIX = _dct_matrix(PHASH_SIZE)
+
+    pixels = np.asarray(img.convert('L').resize((PHASH_SIZE, PHASH_SIZE), Image.LANCZOS), dtype=np.float64)
+    dct = _DCT_MATRIX @ pixels @ _DCT_MATRIX.T
+    low = dct[:PHASH_LOW_FREQUENCIES, :PHASH_LOW_FREQUENCIES].flatten()
+    # Compare against the median without the DC term, which only reflects overall brightness
+    bits = low > np.median(low[1:])
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+def _bands(phash: int):
+    return [(phash >> (8 * band)) & 0xFF for band in range(PHASH_BANDS)]
+
+def normalize_detections(detections, size):
+    """Returns detections with boxes as fractions of the image width and height."""
+    width, height = size
+    return [
+        {**detection, 'bounding_box': [
+            detection['bounding_box'][0] / width, detection['bounding_box'][1] / height,
+            detection['bounding_box'][2] / width, detection['bounding_box'][3] / height,
+        ]}
+        for detection in detections
+    ]
+
+def denormalize_detections(detections, size):
+    """Scales normalized boxes back to pixels of an image of the given size."""
+    width, height = size
+    return [
+        {**detection, 'bounding_box': [
+            detection['bounding_box'][0] * width, detection['bounding_box'][1] * height,
+            detection['bounding_box'][2] * width, detection['bounding_box'][3] * height,
+        ]}
+        for detection in detections
+    ]
+
+
+class PhashCache:
+    """
+    Stores detections by perceptual hash and model version in SQLite.
+
+    A lookup returns the detections of the closest cached hash within
+    `max_distance` bits. Candidates are found through 8-bit bands of the
+    hash, each indexed, so the whole cache is never scanned. Boxes are
+    stored normalized, so they fit a copy of the image at another size.
+    Entries of other model versions are removed when the cache is opened.
+    """
+
+    def __init__(self, path: str, model_version: str, max_distance: int = 4):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if max_distance >= PHASH_BANDS:
+            logging.warning(f"A pHash distance of {max_distance} can miss matches; lookups only guarantee up to {PHASH_BANDS - 1}.")
+        self.path = path
+        self.model_version = model_version
+        self.max_distance = max_distance
+        self.hits = 0
+        self.lookups = 0
+
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        band_columns = ''.join(f"band{band} INTEGER NOT NULL, " for band in range(PHASH_BANDS))
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS phash_cache (
+                phash TEXT NOT NULL,
+                model_version TEXT NOT NULL,
+                {band_columns}
+                detections TEXT NOT NULL,
+                PRIMARY KEY (phash, model_version)
+            );
+        """)
+        for band in range(PHASH_BANDS):
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS phash_cache_band{band} ON phash_cache (model_version, band{band});")
+        self._conn.commit()
+        self.invalidate()
+
+    def invalidate(self):
+        """Removes the entries computed by any other model version."""
+        with self._conn:
+            removed = self._conn.execute(
+                "DELETE FROM phash_cache WHERE model_version != ?;", (self.model_version,)
+            ).rowcount
+        if removed:
+            logging.info(f"Removed {removed} pHash cache entries of other model versions.")
+
+    def lookup(self, phash: int):
+        """
+        Returns the normalized detections of the closest cached image within
+        `max_distance` bits of `phash`, or None.
+        """
+        self.lookups += 1
+        bands = _bands(phash)
+        condition = ' OR '.join(f"band{band} = ?" for band in range(PHASH_BANDS))
+        rows = self._conn.execute(
+            f"SELECT phash, detections FROM phash_cache WHERE model_version = ? AND ({condition});",
+            (self.model_version, *bands)
+        ).fetchall()
+
+        best = None
+        for cached_hash, detections in rows:
+            distance = bin(int(cached_hash, 16) ^ phash).count('1')
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, detections)
+        if best is None:
+            return None
+        self.hits += 1
+        return json.loads(best[1])
+
+    def store(self, phash: int, normalized_detections):
+        """Caches the normalized detections of an image."""
+        with self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO phash_cache VALUES (?, ?, {', '.join('?' * PHASH_BANDS)}, ?);",
+                (f"{phash:016x}", self.model_version, *_bands(phash), json.dumps(normalized_detections))
+            )
+
+    def close(self):
+        self._conn.close()
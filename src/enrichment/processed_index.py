@@ -0,0 +1,82 @@
+# This file contains the crash-safe index of images the enrichment stage has already processed.
+
+import os
+import json
+import sqlite3
+import logging
+from datetime import datetime, timezone
+
+
+class ProcessedIndex:
+    """
+    A SQLite table of processed image keys. Lookups use the primary key, and
+    every image is recorded (and committed) as soon as its detections are
+    saved, so a run that crashes halfway resumes where it stopped.
+
+    The database runs in WAL mode, so several worker processes can record
+    images at the same time while others read.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        # A generous timeout lets concurrent workers wait for each other's short write transactions
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS processed_images (
+                key TEXT PRIMARY KEY,
+                image_path TEXT,
+                content_hash TEXT,
+                model_version TEXT,
+                processed_at TEXT
+            );
+        """)
+        self._conn.commit()
+
+    def __contains__(self, key: str):
+        row = self._conn.execute("SELECT 1 FROM processed_images WHERE key = ?;", (key,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM processed_images;").fetchone()[0]
+
+    def add_many(self, entries):
+        """
+        Records processed images in one transaction.
+
+        Args:
+            entries (list): (key, image_path, content_hash, model_version) tuples.
+        """
+        processed_at = datetime.now(timezone.utc).isoformat()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO processed_images (key, image_path, content_hash, model_version, processed_at) "
+                "VALUES (?, ?, ?, ?, ?);",
+                [(*entry, processed_at) for entry in entries]
+            )
+
+    def add(self, key: str, image_path: str = None, content_hash: str = None, model_version: str = None):
+        """Records one processed image."""
+        self.add_many([(key, image_path, content_hash, model_version)])
+
+    def migrate_json_log(self, log_path: str):
+        """
+        Imports the keys of the old `processed_log.json` list and renames the
+        file, so images processed by earlier versions are not processed again.
+        """
+        if not os.path.exists(log_path):
+            return
+        try:
+            with open(log_path, 'r') as f:
+                keys = json.load(f)
+        except (IOError, json.JSONDecodeError) as e:
+            logging.warning(f"Could not read {log_path} for migration. Skipping it. Error: {e}")
+            return
+        self.add_many([(key, None, None, None) for key in keys])
+        os.replace(log_path, f"{log_path}.migrated")
+        logging.info(f"Migrated {len(keys)} entries of {log_path} to {self.path}.")
+
+    def close(self):
+        self._conn.close()
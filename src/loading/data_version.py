@@ -0,0 +1,42 @@
+# This file contains the data-version marker that tells API caches the warehouse has changed.
+
+import logging
+
+DATA_VERSION_SCHEMA = 'raw'
+DATA_VERSION_TABLE = 'data_version'
+
+
+def ensure_data_version_table(cur):
+    """Creates the single-row data-version table if it does not exist."""
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {DATA_VERSION_SCHEMA};")
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {DATA_VERSION_SCHEMA}.{DATA_VERSION_TABLE} (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version BIGINT NOT NULL,
+            updated_by TEXT,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+    """)
+
+def bump_data_version(cur, updated_by: str):
+    """
+    Increments the data version. The API drops its cached responses when it
+    sees a new version. dbt bumps it as well, in its on-run-end hook.
+
+    Args:
+        cur: An open cursor; the bump commits with the caller's transaction.
+        updated_by (str): The step that changed the data, e.g. 'loader'.
+
+    Returns:
+        int: The new version.
+    """
+    ensure_data_version_table(cur)
+    cur.execute(f"""
+        INSERT INTO {DATA_VERSION_SCHEMA}.{DATA_VERSION_TABLE} (id, version, updated_by) VALUES (1, 1, %s)
+        ON CONFLICT (id) DO UPDATE
+        SET version = {DATA_VERSION_TABLE}.version + 1, updated_by = EXCLUDED.updated_by, updated_at = NOW()
+        RETURNING version;
+    """, (updated_by,))
+    version = cur.fetchone()[0]
+    logging.info(f"Bumped the data version to {version}.")
+    return version
@@ -0,0 +1,100 @@
+# This file contains a streaming parser for files holding one large JSON array.
+
+import json
+from itertools import islice
+
+JSON_STREAM_CHUNK_SIZE = 64 * 1024 # Characters read from the file at a time
+
+_WHITESPACE = ' \t\n\r'
+
+
+def iter_json_array(f, chunk_size: int = JSON_STREAM_CHUNK_SIZE):
+    """
+    Yields the elements of a top-level JSON array one at a time, reading the
+    file in chunks, so memory stays bounded by the largest single element
+    instead of the size of the file.
+
+    Args:
+        f: A text file object positioned at the start of the array.
+        chunk_size (int): Characters read per chunk.
+
+    Raises:
+        ValueError: If the file does not hold a JSON array.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    read_size = chunk_size
+
+    def fill():
+        """Drops the consumed part of the buffer and appends the next chunk."""
+        nonlocal buffer, pos, eof, read_size
+        chunk = f.read(read_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    skip_whitespace()
+    if pos >= len(buffer) or buffer[pos] != '[':
+        raise ValueError("Expected a JSON array.")
+    pos += 1
+
+    expect_value = True
+    skip_whitespace()
+    if pos < len(buffer) and buffer[pos] == ']':
+        return
+
+    while True:
+        skip_whitespace()
+        if pos >= len(buffer):
+            raise ValueError("Unexpected end of file inside a JSON array.")
+
+        if not expect_value:
+            if buffer[pos] == ']':
+                return
+            if buffer[pos] != ',':
+                raise ValueError(f"Expected ',' or ']' in a JSON array, found {buffer[pos]!r}.")
+            pos += 1
+            expect_value = True
+            continue
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            value, end = None, None
+        # A number cut off by the end of the buffer also decodes, so a value only counts
+        # as complete once it is followed by a delimiter
+        complete = end is not None and (end < len(buffer) and buffer[end] in _WHITESPACE + ',]' or eof)
+        if not complete:
+            if eof:
+                raise ValueError("Invalid or truncated value in a JSON array.")
+            # Read larger chunks while one element spans several of them
+            fill()
+            read_size *= 2
+            continue
+
+        read_size = chunk_size
+        pos = end
+        expect_value = False
+        yield value
+
+
+def iter_json_array_batches(f, batch_size: int, chunk_size: int = JSON_STREAM_CHUNK_SIZE):
+    """Yields lists of up to `batch_size` elements of a top-level JSON array."""
+    elements = iter_json_array(f, chunk_size)
+    while True:
+        batch = list(islice(elements, batch_size))
+        if not batch:
+            return
+        yield batch
@@ -1,11 +1,16 @@
 # src/loading/load_detection_results.py
 
+import io
 import os
+import csv
 import json
 import psycopg2
-from psycopg2.extras import Json
+from psycopg2.extras import Json, execute_values
 from dotenv import load_dotenv
 import logging
+import argparse
+from loading.json_stream import iter_json_array_batches
+from loading.data_version import bump_data_version
 
 # --- Configuration ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -13,7 +18,12 @@ load_dotenv()
 
 # --- Paths ---
 PROCESSED_DIR = 'data/processed/image_detections'
-LOG_FILE = os.path.join(PROCESSED_DIR, 'loaded_files.log')
+# Newline-delimited shards written by the enrichment stage. A shard is loaded once its
+# '.index.json' exists, i.e. once the run that wrote it has closed it.
+SHARDS_DIR = os.path.join(PROCESSED_DIR, 'shards')
+SHARD_SUFFIX = '.ndjson'
+SHARD_INDEX_SUFFIX = '.index.json'
+LOG_FILE = os.path.join(PROCESSED_DIR, 'loaded_files.log') # Replaced by the manifest table, migrated on the first run
 
 # --- Database Connection Details ---
 DB_NAME = os.getenv('POSTGRES_DB')
@@ -25,6 +35,22 @@ DB_PORT = os.getenv('POSTGRES_PORT', 5432)
 # --- Schema and Table Names ---
 SCHEMA_NAME = 'raw_data'
 TABLE_NAME = 'image_detections'
+MANIFEST_TABLE_NAME = 'image_detections_manifest'
+ROWS_TABLE_NAME = 'image_detection_rows'
+ROWS_MANIFEST_TABLE_NAME = 'image_detection_rows_manifest'
+
+# --- Load Format ---
+# 'jsonb' stores the detections of each file as JSONB arrays in image_detections.
+# 'rows' copies one typed row per detection into image_detection_rows, so dbt needs no JSON
+# expansion (set the dbt var detections_format to 'rows' to read it).
+DETECTION_LOAD_FORMAT = os.getenv('DETECTION_LOAD_FORMAT', 'jsonb')
+
+# --- Streaming ---
+# Detection files are parsed incrementally and inserted as JSON arrays (or COPY chunks) of at
+# most about this many detections, so a large file never has to fit in memory.
+DETECTION_BATCH_SIZE = int(os.getenv('DETECTION_BATCH_SIZE', 1000))
+# Files loaded per transaction. The rows and manifest entries of a batch are committed together.
+DETECTION_FILES_PER_BATCH = int(os.getenv('DETECTION_FILES_PER_BATCH', 500))
 
 def get_db_connection():
     """Establishes a connection to the PostgreSQL database."""
@@ -42,64 +68,247 @@ def get_db_connection():
         logging.error(f"Could not connect to the database: {e}")
         return None
 
-def get_loaded_files():
-    """Reads the log of already loaded files to prevent duplicates."""
+def ensure_tables(cur):
+    """Creates the schema, the detections table and the manifest of loaded files."""
+    # 1. Create the schema if it doesn't exist
+    logging.info(f"Ensuring schema '{SCHEMA_NAME}' exists.")
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA_NAME};")
+
+    # 2. Create the table if it doesn't exist
+    logging.info(f"Ensuring table '{SCHEMA_NAME}.{TABLE_NAME}' exists.")
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA_NAME}.{TABLE_NAME} (
+            id SERIAL PRIMARY KEY,
+            data JSONB,
+            loaded_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+    """)
+
+    # 3. The typed table: one row per detection
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA_NAME}.{ROWS_TABLE_NAME} (
+            message_id BIGINT,
+            channel_name VARCHAR(255),
+            detected_object_class TEXT,
+            confidence_score DOUBLE PRECISION,
+            box_x1 REAL,
+            box_y1 REAL,
+            box_x2 REAL,
+            box_y2 REAL,
+            loaded_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+    """)
+    # Shards record the model that produced each detection
+    cur.execute(f"ALTER TABLE {SCHEMA_NAME}.{ROWS_TABLE_NAME} ADD COLUMN IF NOT EXISTS model_version TEXT;")
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS {ROWS_TABLE_NAME}_message
+        ON {SCHEMA_NAME}.{ROWS_TABLE_NAME} (channel_name, message_id);
+    """)
+
+    # 4. One row per loaded file, written in the same transaction as the file's data.
+    # Each table has its own manifest, so switching formats loads every file into the new table.
+    for manifest_table in (MANIFEST_TABLE_NAME, ROWS_MANIFEST_TABLE_NAME):
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SCHEMA_NAME}.{manifest_table} (
+                file_name TEXT PRIMARY KEY,
+                loaded_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            );
+        """)
+
+def migrate_log_file(cur):
+    """
+    Copies the file names of the old loaded_files.log into the manifest table
+    and renames the log, so files loaded by earlier versions are not loaded again.
+    """
     if not os.path.exists(LOG_FILE):
-        return set()
+        return
     with open(LOG_FILE, 'r') as f:
-        return set(f.read().splitlines())
+        filenames = [line for line in f.read().splitlines() if line]
+    execute_values(
+        cur,
+        f"INSERT INTO {SCHEMA_NAME}.{MANIFEST_TABLE_NAME} (file_name) VALUES %s ON CONFLICT DO NOTHING;",
+        [(filename,) for filename in filenames],
+        page_size=10000
+    )
+    logging.info(f"Migrated {len(filenames)} entries of {LOG_FILE} to {SCHEMA_NAME}.{MANIFEST_TABLE_NAME}.")
+
+def find_new_files(cur, manifest_table: str = MANIFEST_TABLE_NAME):
+    """
+    Returns the detection files that are not in the given manifest yet, sorted by name.
+    These are the per-message '.json' files of earlier versions and the
+    closed shards, named 'shards/<shard>.ndjson'.
+
+    The directories are listed with os.scandir and the names are sent to a
+    temporary table with a single COPY, so the comparison with the manifest
+    is one anti-join in PostgreSQL however many files there are.
+    """
+    buffer = io.StringIO()
+    with os.scandir(PROCESSED_DIR) as entries:
+        for entry in entries:
+            if entry.name.endswith('.json') and entry.is_file():
+                buffer.write(entry.name + '\n')
+    if os.path.isdir(SHARDS_DIR):
+        with os.scandir(SHARDS_DIR) as entries:
+            for entry in entries:
+                if entry.name.endswith(SHARD_INDEX_SUFFIX):
+                    shard_name = entry.name[:-len(SHARD_INDEX_SUFFIX)] + SHARD_SUFFIX
+                    buffer.write(f"{os.path.basename(SHARDS_DIR)}/{shard_name}\n")
+    buffer.seek(0)
 
-def log_loaded_file(filename):
-    """Adds a filename to the log of loaded files."""
-    with open(LOG_FILE, 'a') as f:
-        f.write(filename + '\n')
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS detection_files (file_name TEXT) ON COMMIT DROP;")
+    cur.copy_expert("COPY detection_files (file_name) FROM STDIN", buffer)
+    cur.execute(f"""
+        SELECT detection_files.file_name
+        FROM detection_files
+        LEFT JOIN {SCHEMA_NAME}.{manifest_table} manifest USING (file_name)
+        WHERE manifest.file_name IS NULL
+        ORDER BY detection_files.file_name;
+    """)
+    return [row[0] for row in cur.fetchall()]
 
-def load_data():
+def iter_shard_detections(f):
+    """
+    Yields the detections of a shard one at a time, each with the channel,
+    message id and model version of its record, like the per-message files.
+    """
+    for line in f:
+        record = json.loads(line)
+        for detection in record['detections']:
+            yield {
+                'message_id': record['message_id'],
+                'channel_name': record['channel_name'],
+                'model_version': record['model_version'],
+                **detection,
+            }
+
+def read_detection_batches(filename):
+    """Yields the detections of one file as lists of at most DETECTION_BATCH_SIZE detections."""
+    filepath = os.path.join(PROCESSED_DIR, filename)
+    with open(filepath, 'r') as f:
+        if not filename.endswith(SHARD_SUFFIX):
+            yield from iter_json_array_batches(f, DETECTION_BATCH_SIZE)
+            return
+        batch = []
+        for detection in iter_shard_detections(f):
+            batch.append(detection)
+            if len(batch) >= DETECTION_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def _insert_json_rows(cur, rows):
+    """Inserts JSONB arrays of detections into image_detections with one statement."""
+    execute_values(cur, f"INSERT INTO {SCHEMA_NAME}.{TABLE_NAME} (data) VALUES %s;", rows, page_size=len(rows))
+
+def insert_json_batches(cur, filenames):
+    """
+    Inserts the detections of the given files as JSONB arrays of at most
+    DETECTION_BATCH_SIZE detections. An INSERT is issued every
+    DETECTION_BATCH_SIZE detections, so a statement never carries more than
+    about two batches however many files the transaction loads.
+    """
+    # Each batch of detections is stored as its own JSON array, which jsonb_array_elements unpacks as before
+    rows = []
+    detections = 0
+    for filename in filenames:
+        for batch in read_detection_batches(filename):
+            rows.append((Json(batch),))
+            detections += len(batch)
+            if detections >= DETECTION_BATCH_SIZE:
+                _insert_json_rows(cur, rows)
+                rows = []
+                detections = 0
+    if rows:
+        _insert_json_rows(cur, rows)
+
+def _copy_rows(cur, buffer: io.StringIO):
+    """Copies the CSV rows written to the buffer into the typed table."""
+    buffer.seek(0)
+    cur.copy_expert(f"""
+        COPY {SCHEMA_NAME}.{ROWS_TABLE_NAME}
+            (message_id, channel_name, detected_object_class, confidence_score, box_x1, box_y1, box_x2, box_y2,
+             model_version)
+        FROM STDIN WITH (FORMAT csv)
+    """, buffer)
+
+def copy_detection_rows(cur, filenames):
+    """
+    Streams the detections of the given files into the typed table. A COPY is
+    issued every DETECTION_BATCH_SIZE rows, so memory use stays bounded however
+    many detections the files hold.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    rows = 0
+    for filename in filenames:
+        for batch in read_detection_batches(filename):
+            for detection in batch:
+                box = detection.get('bounding_box') or [None] * 4 # [x1, y1, x2, y2]
+                writer.writerow([
+                    detection.get('message_id'), detection.get('channel_name'),
+                    detection.get('detected_object_class'), detection.get('confidence_score'), *box[:4],
+                    detection.get('model_version')
+                ])
+            rows += len(batch)
+            if rows >= DETECTION_BATCH_SIZE:
+                _copy_rows(cur, buffer)
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                rows = 0
+    if rows:
+        _copy_rows(cur, buffer)
+
+def load_data(load_format: str = DETECTION_LOAD_FORMAT):
     """
     Main function to load new JSON detection results into the database.
+
+    New files are loaded DETECTION_FILES_PER_BATCH at a time. Each batch is one
+    multi-row INSERT (or COPY) of detections plus one INSERT into the manifest,
+    committed together, so a crash never skips or duplicates a file.
+
+    Args:
+        load_format (str): 'jsonb' for JSONB arrays in image_detections, or 'rows'
+            for typed rows in image_detection_rows.
     """
+    manifest_table = ROWS_MANIFEST_TABLE_NAME if load_format == 'rows' else MANIFEST_TABLE_NAME
     conn = get_db_connection()
     if not conn:
         return
 
     try:
         with conn.cursor() as cur:
-            # 1. Create the schema if it doesn't exist
-            logging.info(f"Ensuring schema '{SCHEMA_NAME}' exists.")
-            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA_NAME};")
-
-            # 2. Create the table if it doesn't exist
-            logging.info(f"Ensuring table '{SCHEMA_NAME}.{TABLE_NAME}' exists.")
-            cur.execute(f"""
-                CREATE TABLE IF NOT EXISTS {SCHEMA_NAME}.{TABLE_NAME} (
-                    id SERIAL PRIMARY KEY,
-                    data JSONB,
-                    loaded_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-                );
-            """)
-
-            # 3. Load new data
-            loaded_files = get_loaded_files()
-            files_to_load = [f for f in os.listdir(PROCESSED_DIR) if f.endswith('.json') and f not in loaded_files]
+            ensure_tables(cur)
+            migrate_log_file(cur)
+            conn.commit()
+            if os.path.exists(LOG_FILE):
+                os.replace(LOG_FILE, f"{LOG_FILE}.migrated")
+
+            # Load new data
+            files_to_load = find_new_files(cur, manifest_table)
+            conn.commit()
 
             if not files_to_load:
                 logging.info("No new detection files to load.")
                 return
 
             logging.info(f"Found {len(files_to_load)} new files to load.")
-            for filename in files_to_load:
-                filepath = os.path.join(PROCESSED_DIR, filename)
-                with open(filepath, 'r') as f:
-                    json_data = json.load(f)
-                
-                # Insert the JSON data into the table
-                cur.execute(
-                    f"INSERT INTO {SCHEMA_NAME}.{TABLE_NAME} (data) VALUES (%s);",
-                    (Json(json_data),) # Use psycopg2.extras.Json to handle JSON correctly
+            for start in range(0, len(files_to_load), DETECTION_FILES_PER_BATCH):
+                filenames = files_to_load[start:start + DETECTION_FILES_PER_BATCH]
+                if load_format == 'rows':
+                    copy_detection_rows(cur, filenames)
+                else:
+                    insert_json_batches(cur, filenames)
+                execute_values(
+                    cur,
+                    f"INSERT INTO {SCHEMA_NAME}.{manifest_table} (file_name) VALUES %s;",
+                    [(filename,) for filename in filenames],
+                    page_size=len(filenames)
                 )
-                log_loaded_file(filename)
-                logging.info(f"Loaded data from {filename}.")
+                conn.commit()
+                logging.info(f"Loaded {len(filenames)} detection files ({start + len(filenames)} of {len(files_to_load)}).")
 
+            bump_data_version(cur, 'detection_loader')
             conn.commit()
             logging.info("All new files loaded and committed successfully.")
 
@@ -113,4 +322,8 @@ def load_data():
             logging.info("Database connection closed.")
 
 if __name__ == '__main__':
-    load_data()
+    parser = argparse.ArgumentParser(description="Load YOLO detection results into PostgreSQL.")
+    parser.add_argument('--format', dest='load_format', choices=['jsonb', 'rows'], default=DETECTION_LOAD_FORMAT)
+    args = parser.parse_args()
+
+    load_data(load_format=args.load_format)
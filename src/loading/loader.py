@@ -1,11 +1,28 @@
 # This new script loads the raw JSON files from the data lake into PostgreSQL.
 
+import io
 import os
+import csv
 import json
+import hashlib
 import logging
+import argparse
 import psycopg2
 import time
-from psycopg2.extras import Json
+import queue
+from datetime import date, timedelta
+from collections import deque
+from itertools import islice
+from multiprocessing import Manager
+from concurrent.futures import ProcessPoolExecutor
+from loading.json_stream import iter_json_array
+from loading.data_version import bump_data_version
+from scraping.parquet_lake import PARQUET_LAKE_PATH, MESSAGE_COLUMNS, list_part_files, read_part_file
+
+try:
+    import orjson
+except ImportError: # orjson is optional, the standard library json module is used without it
+    orjson = None
 
 # --- Logging Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -19,6 +36,28 @@ DB_HOST = os.getenv("POSTGRES_HOST", "db") # 'db' is the service name in docker-
 DB_PORT = os.getenv("POSTGRES_PORT", "5432")
 
 DATA_LAKE_PATH = 'data/raw/telegram_messages'
+PARTITION_EXTENSIONS = ('.jsonl', '.json') # NDJSON partitions and legacy JSON array partitions
+LAKE_FORMAT = os.getenv("LAKE_FORMAT", "ndjson") # 'ndjson' or 'parquet'
+
+# --- Bulk Loading ---
+LOAD_METHOD = os.getenv("LOAD_METHOD", "copy") # 'copy' streams batches with COPY, 'insert' runs one INSERT per row
+LOAD_BATCH_SIZE = int(os.getenv("LOAD_BATCH_SIZE", 5000)) # Rows sent to PostgreSQL per batch
+
+# --- Load Modes ---
+# 'incremental' loads only new or changed lake files (tracked in raw.raw_messages_manifest)
+# and upserts them on (channel_name, message_id). 'full' truncates the table and reloads the whole lake.
+LOAD_MODE = os.getenv("LOAD_MODE", "incremental")
+
+# --- Table Partitioning ---
+# With RAW_PARTITIONED=1, raw.raw_messages is a table range-partitioned by month of message_date.
+# An existing unpartitioned table is migrated on the next load.
+RAW_PARTITIONED = os.getenv("RAW_PARTITIONED", "0") == "1"
+
+# --- Parallel Parsing ---
+# With LOAD_PARSE_WORKERS > 0, lake files are parsed by a pool of processes while this
+# process only writes to PostgreSQL. 0 parses and writes in the same process.
+LOAD_PARSE_WORKERS = int(os.getenv("LOAD_PARSE_WORKERS", 0))
+LOAD_QUEUE_SIZE = int(os.getenv("LOAD_QUEUE_SIZE", 8)) # Parsed row chunks held in memory waiting for the writer
 
 def get_db_connection():
     """Establishes and returns a connection to the PostgreSQL database."""
@@ -40,10 +79,523 @@ def get_db_connection():
             time.sleep(5)
     return None
 
-def load_data_to_postgres():
+def loads_json(data):
+    """Parses JSON text with orjson when it is installed."""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def dumps_message(message: dict):
+    """Serializes a message for JSONB, keeping non-ASCII text as is."""
+    if orjson:
+        return orjson.dumps(message).decode('utf-8')
+    return json.dumps(message, ensure_ascii=False)
+
+def read_partition_file(file_path):
+    """
+    Yields the messages of one data lake partition file.
+
+    NDJSON files ('.jsonl') are read one line at a time. Parquet part files are
+    read in record batches. Legacy files ('.json') hold a single JSON array whose
+    elements are parsed incrementally, so memory does not grow with the file size.
+    """
+    if file_path.endswith('.parquet'):
+        yield from read_part_file(file_path, columns=list(MESSAGE_COLUMNS))
+        return
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        if file_path.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    yield loads_json(line)
+        else:
+            yield from iter_json_array(f)
+
+def list_lake_files(since_date: str = None):
+    """
+    Lists the partition files of the data lake.
+
+    Args:
+        since_date (str, optional): Only list date partitions on or after this day ('YYYY-MM-DD').
+
+    Returns:
+        list: (channel_name, file_path) tuples in load order.
+    """
+    if LAKE_FORMAT == 'parquet':
+        # Partitions are pruned by directory name
+        return list_part_files(PARQUET_LAKE_PATH, since_date=since_date)
+
+    lake_files = []
+    for date_folder in sorted(os.listdir(DATA_LAKE_PATH)):
+        date_path = os.path.join(DATA_LAKE_PATH, date_folder)
+        if not os.path.isdir(date_path) or (since_date and date_folder < since_date):
+            continue
+
+        for json_file in sorted(os.listdir(date_path)):
+            if json_file.endswith(PARTITION_EXTENSIONS):
+                lake_files.append((os.path.splitext(json_file)[0], os.path.join(date_path, json_file)))
+    return lake_files
+
+def file_sha256(file_path: str):
+    """Returns the SHA-256 hash of a file, read in 1 MB chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _table_kind(cur, table: str):
+    """Returns 'r' for a plain table, 'p' for a partitioned table, or None if the table does not exist."""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s);", (table,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def create_partitioned_table(cur):
+    """
+    Creates raw.raw_messages range-partitioned by message_date. A unique key must
+    contain the partition column, so the parent's natural key is
+    (channel_name, message_id, message_date). Every partition, including the
+    default one for messages without a date, also gets its own unique
+    (channel_name, message_id) index.
+    """
+    cur.execute("""
+        CREATE TABLE raw.raw_messages (
+            id BIGSERIAL,
+            channel_name VARCHAR(255),
+            message_id BIGINT,
+            message_date TIMESTAMP,
+            message_data JSONB,
+            loaded_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        ) PARTITION BY RANGE (message_date);
+    """)
+    cur.execute("""
+        CREATE UNIQUE INDEX raw_messages_natural_key
+        ON raw.raw_messages (channel_name, message_id, message_date);
+    """)
+    # Catches messages without a date, which no monthly partition accepts
+    cur.execute("CREATE TABLE raw.raw_messages_default PARTITION OF raw.raw_messages DEFAULT;")
+    cur.execute("CREATE UNIQUE INDEX raw_messages_default_natural_key ON raw.raw_messages_default (channel_name, message_id);")
+
+def create_month_partition(cur, month_start: date):
+    """Creates the partition of raw.raw_messages holding one calendar month, if it does not exist yet."""
+    name = f"raw_messages_p{month_start:%Y_%m}"
+    if _table_kind(cur, f"raw.{name}"):
+        return
+    next_month = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    logging.info(f"Creating partition raw.{name} for messages from {month_start} to {next_month}.")
+    cur.execute(
+        f"CREATE TABLE raw.{name} PARTITION OF raw.raw_messages FOR VALUES FROM (%s) TO (%s);",
+        (month_start, next_month)
+    )
+    cur.execute(f"CREATE UNIQUE INDEX {name}_natural_key ON raw.{name} (channel_name, message_id);")
+
+def create_partitions_for(cur, source: str, date_expression: str):
+    """Creates the monthly partitions needed by every date found in `source`."""
+    cur.execute(f"""
+        SELECT DISTINCT date_trunc('month', {date_expression})::date
+        FROM {source} WHERE {date_expression} IS NOT NULL;
+    """)
+    for (month_start,) in cur.fetchall():
+        create_month_partition(cur, month_start)
+
+def drop_dependent_views(cur, table: str):
+    """
+    Drops the views (e.g. dbt's stg_telegram_messages) built on a table, with
+    CASCADE so views built on those go too. Postgres moves views along when
+    their table is renamed, so they would otherwise keep the old table alive.
+
+    Returns:
+        list: The names of the dropped views.
+    """
+    cur.execute("""
+        SELECT DISTINCT view.oid::regclass::text
+        FROM pg_depend dependency
+        JOIN pg_rewrite rule ON rule.oid = dependency.objid
+        JOIN pg_class view ON view.oid = rule.ev_class
+        WHERE dependency.refobjid = %s::regclass
+          AND view.oid <> dependency.refobjid
+          AND view.relkind IN ('v', 'm');
+    """, (table,))
+    views = [row[0] for row in cur.fetchall()]
+    for view in views:
+        cur.execute(f"DROP {'MATERIALIZED VIEW' if _table_kind(cur, view) == 'm' else 'VIEW'} IF EXISTS {view} CASCADE;")
+    return views
+
+def migrate_to_partitioned(cur):
+    """
+    Moves an existing unpartitioned raw.raw_messages into a new partitioned
+    table. Views on raw.raw_messages are dropped; the next `dbt run` rebuilds them.
+    """
+    logging.info("Migrating raw.raw_messages to a table partitioned by message_date.")
+    dropped_views = drop_dependent_views(cur, 'raw.raw_messages')
+    if dropped_views:
+        logging.warning(f"Dropped views on raw.raw_messages (and views built on them): {', '.join(dropped_views)}. "
+                        "Run `dbt run` after the load to rebuild them.")
+    cur.execute("ALTER TABLE raw.raw_messages RENAME TO raw_messages_unpartitioned;")
+    cur.execute("ALTER INDEX IF EXISTS raw.raw_messages_natural_key RENAME TO raw_messages_unpartitioned_natural_key;")
+    cur.execute("ALTER INDEX IF EXISTS raw.raw_messages_message_date RENAME TO raw_messages_unpartitioned_message_date;")
+    create_partitioned_table(cur)
+    create_partitions_for(cur, 'raw.raw_messages_unpartitioned', 'message_date')
+    cur.execute("""
+        INSERT INTO raw.raw_messages (channel_name, message_id, message_date, message_data, loaded_at)
+        SELECT channel_name, message_id, message_date, message_data, loaded_at
+        FROM raw.raw_messages_unpartitioned;
+    """)
+    cur.execute("DROP TABLE raw.raw_messages_unpartitioned;")
+
+def ensure_tables(cur, partitioned: bool = RAW_PARTITIONED):
+    """
+    Creates the raw schema, the raw_messages table and the load manifest.
+
+    raw_messages gets a natural key of (channel_name, message_id). Tables
+    created by older versions of the loader get the message_id and
+    message_date columns backfilled from the JSON and are deduplicated before
+    the unique index is built. With `partitioned`, a plain table is migrated
+    to a table partitioned by month of message_date.
+
+    Returns:
+        bool: True if raw.raw_messages is partitioned.
+    """
+    # Create a schema for our raw data if it doesn't exist
+    cur.execute("CREATE SCHEMA IF NOT EXISTS raw;")
+    table_kind = _table_kind(cur, 'raw.raw_messages')
+    if table_kind is None and partitioned:
+        create_partitioned_table(cur)
+        table_kind = 'p'
+    # Create the table to hold the raw JSON data
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS raw.raw_messages (
+            id SERIAL PRIMARY KEY,
+            channel_name VARCHAR(255),
+            message_id BIGINT,
+            message_date TIMESTAMP,
+            message_data JSONB,
+            loaded_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+    """)
+
+    if table_kind != 'p':
+        cur.execute("SELECT to_regclass('raw.raw_messages_natural_key');")
+        if cur.fetchone()[0] is None:
+            logging.info("Adding the (channel_name, message_id) natural key to raw.raw_messages.")
+            cur.execute("ALTER TABLE raw.raw_messages ADD COLUMN IF NOT EXISTS message_id BIGINT;")
+            cur.execute("""
+                UPDATE raw.raw_messages SET message_id = (message_data ->> 'id')::bigint
+                WHERE message_id IS NULL;
+            """)
+            # Keep only the most recently loaded copy of each message
+            cur.execute("""
+                DELETE FROM raw.raw_messages older USING raw.raw_messages newer
+                WHERE older.channel_name = newer.channel_name
+                  AND older.message_id = newer.message_id
+                  AND older.id < newer.id;
+            """)
+            cur.execute("""
+                CREATE UNIQUE INDEX raw_messages_natural_key
+                ON raw.raw_messages (channel_name, message_id);
+            """)
+
+        cur.execute("SELECT to_regclass('raw.raw_messages_message_date');")
+        if cur.fetchone()[0] is None:
+            logging.info("Adding the message_date column to raw.raw_messages.")
+            cur.execute("ALTER TABLE raw.raw_messages ADD COLUMN IF NOT EXISTS message_date TIMESTAMP;")
+            cur.execute("""
+                UPDATE raw.raw_messages SET message_date = (message_data ->> 'date')::timestamp
+                WHERE message_date IS NULL;
+            """)
+            cur.execute("CREATE INDEX raw_messages_message_date ON raw.raw_messages (message_date);")
+
+        if partitioned:
+            migrate_to_partitioned(cur)
+            table_kind = 'p'
+    else:
+        cur.execute("SELECT to_regclass('raw.raw_messages_default_natural_key');")
+        if cur.fetchone()[0] is None:
+            # Older loaders could keep a message twice: in the default partition or in two months
+            logging.info("Removing duplicate messages and adding a natural key to raw.raw_messages_default.")
+            cur.execute("""
+                DELETE FROM raw.raw_messages older USING raw.raw_messages newer
+                WHERE older.channel_name = newer.channel_name
+                  AND older.message_id = newer.message_id
+                  AND older.id < newer.id;
+            """)
+            cur.execute("""
+                CREATE UNIQUE INDEX raw_messages_default_natural_key
+                ON raw.raw_messages_default (channel_name, message_id);
+            """)
+
+    # One row per lake file that has been loaded
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS raw.raw_messages_manifest (
+            file_path TEXT PRIMARY KEY,
+            file_size BIGINT NOT NULL,
+            file_mtime DOUBLE PRECISION NOT NULL,
+            file_sha256 TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            loaded_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        );
+    """)
+    logging.info(f"Schema 'raw', table 'raw_messages' ({'partitioned' if table_kind == 'p' else 'unpartitioned'}) and its load manifest are ready.")
+    return table_kind == 'p'
+
+def drop_partitions_before(cur, before_date: str):
+    """
+    Drops the monthly partitions of raw.raw_messages that only hold messages
+    older than `before_date` ('YYYY-MM-DD'). Dropping a partition is instant,
+    unlike deleting its rows.
+
+    Returns:
+        list: The names of the dropped partitions.
+    """
+    cur.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_namespace ON pg_namespace.oid = parent.relnamespace
+        WHERE pg_namespace.nspname = 'raw' AND parent.relname = 'raw_messages'
+          AND child.relname LIKE 'raw\\_messages\\_p%'
+        ORDER BY child.relname;
+    """)
+    cutoff = date.fromisoformat(before_date)
+    dropped = []
+    for (name,) in cur.fetchall():
+        year, month = name[len('raw_messages_p'):].split('_')
+        month_start = date(int(year), int(month), 1)
+        next_month = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        if next_month <= cutoff:
+            cur.execute(f"DROP TABLE raw.{name};")
+            dropped.append(name)
+            logging.info(f"Dropped partition raw.{name} (messages before {next_month}).")
+    return dropped
+
+def _batched(iterable, size: int):
+    """Yields lists of up to `size` items from an iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def insert_rows(cur, rows, table: str = 'raw_messages_stage'):
+    """Inserts (channel_name, message_json) rows one INSERT at a time."""
+    for channel_name, message_json in rows:
+        cur.execute(
+            f"INSERT INTO {table} (channel_name, message_data) VALUES (%s, %s::jsonb);",
+            (channel_name, message_json)
+        )
+
+def copy_rows(cur, rows, table: str = 'raw_messages_stage'):
+    """Streams (channel_name, message_json) rows into a table with a single COPY."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} (channel_name, message_data) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def write_rows(cur, rows, method: str = LOAD_METHOD, batch_size: int = LOAD_BATCH_SIZE,
+               table: str = 'raw_messages_stage'):
+    """
+    Writes (channel_name, message_json) rows in batches of `batch_size`.
+
+    With method='copy' each batch is sent with COPY inside a savepoint. If a
+    COPY fails, only that batch is rolled back and retried row by row, so one
+    bad batch does not abort the whole load.
+
+    Returns:
+        int: The number of rows written.
+    """
+    written = 0
+    for batch in _batched(rows, batch_size):
+        if method == 'copy':
+            cur.execute("SAVEPOINT load_batch;")
+            try:
+                copy_rows(cur, batch, table)
+                cur.execute("RELEASE SAVEPOINT load_batch;")
+            except psycopg2.Error as e:
+                logging.warning(f"COPY of a {len(batch)}-row batch failed ({str(e).strip()}). Falling back to row-by-row inserts.")
+                cur.execute("ROLLBACK TO SAVEPOINT load_batch;")
+                insert_rows(cur, batch, table)
+        else:
+            insert_rows(cur, batch, table)
+        written += len(batch)
+    return written
+
+def create_stage_table(cur):
+    """Creates the session-local staging table that lake files are written into before the upsert."""
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS raw_messages_stage (
+            seq BIGSERIAL,
+            channel_name VARCHAR(255),
+            message_data JSONB
+        );
+    """)
+
+def merge_stage_table(cur, partitioned: bool = False):
+    """
+    Upserts the staged rows into raw.raw_messages on its natural key and
+    empties the staging table. Within the stage the last row of a message wins.
+    Rows whose JSON did not change are left untouched. For a partitioned
+    table, the monthly partitions the rows need are created first.
+
+    A partitioned table can only enforce (channel_name, message_id) within
+    each partition, so there a changed message is deleted from whichever
+    partition holds it and inserted again. A message whose date changed
+    therefore moves to its new month, and messages without a date are kept
+    once in the default partition.
+    """
+    if not partitioned:
+        cur.execute("""
+            INSERT INTO raw.raw_messages (channel_name, message_id, message_date, message_data)
+            SELECT DISTINCT ON (channel_name, (message_data ->> 'id')::bigint)
+                channel_name, (message_data ->> 'id')::bigint, (message_data ->> 'date')::timestamp, message_data
+            FROM raw_messages_stage
+            ORDER BY channel_name, (message_data ->> 'id')::bigint, seq DESC
+            ON CONFLICT (channel_name, message_id) DO UPDATE
+                SET message_data = EXCLUDED.message_data, message_date = EXCLUDED.message_date, loaded_at = NOW()
+                WHERE raw.raw_messages.message_data IS DISTINCT FROM EXCLUDED.message_data;
+        """)
+        cur.execute("TRUNCATE raw_messages_stage;")
+        return
+
+    create_partitions_for(cur, 'raw_messages_stage', "(message_data ->> 'date')::timestamp")
+    cur.execute("""
+        DELETE FROM raw_messages_stage older USING raw_messages_stage newer
+        WHERE older.channel_name = newer.channel_name
+          AND older.message_data ->> 'id' = newer.message_data ->> 'id'
+          AND older.seq < newer.seq;
+    """)
+    cur.execute("""
+        DELETE FROM raw.raw_messages existing USING raw_messages_stage stage
+        WHERE existing.channel_name = stage.channel_name
+          AND existing.message_id = (stage.message_data ->> 'id')::bigint
+          AND existing.message_data IS DISTINCT FROM stage.message_data;
+    """)
+    # Whatever is still there for a staged message is an unchanged copy
+    cur.execute("""
+        INSERT INTO raw.raw_messages (channel_name, message_id, message_date, message_data)
+        SELECT channel_name, (message_data ->> 'id')::bigint, (message_data ->> 'date')::timestamp, message_data
+        FROM raw_messages_stage stage
+        WHERE NOT EXISTS (
+            SELECT 1 FROM raw.raw_messages existing
+            WHERE existing.channel_name = stage.channel_name
+              AND existing.message_id = (stage.message_data ->> 'id')::bigint
+        );
+    """)
+    cur.execute("TRUNCATE raw_messages_stage;")
+
+def serialize_file(channel_name: str, file_path: str):
+    """Yields the (channel_name, message_json) rows of one lake file."""
+    for message in read_partition_file(file_path):
+        yield channel_name, dumps_message(message)
+
+def parse_file(channel_name: str, file_path: str, chunks, chunk_size: int):
+    """
+    Parses one lake file into lists of at most `chunk_size` rows and puts them on the
+    `chunks` queue, followed by None. Runs in a parse worker process; a full queue
+    blocks the worker until the writer catches up.
+    """
+    try:
+        rows = serialize_file(channel_name, file_path)
+        for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+            chunks.put(chunk)
+    finally:
+        # The writer stops reading at None; a parse error is raised from the future
+        chunks.put(None)
+
+def _iter_chunks(chunks, future):
+    """Yields the rows a parse worker puts on its queue, then re-raises any worker error."""
+    for chunk in iter(chunks.get, None):
+        yield from chunk
+    future.result()
+
+def iter_parsed_files(pending_files, workers: int = LOAD_PARSE_WORKERS, queue_size: int = LOAD_QUEUE_SIZE,
+                      chunk_size: int = LOAD_BATCH_SIZE):
+    """
+    Yields (pending_file, rows) for every pending lake file, in order.
+
+    With workers > 0 the files are parsed by a process pool, one file per
+    worker. Each worker hands its rows over in chunks of `chunk_size` rows
+    through a bounded queue, so at most `queue_size` chunks wait for the
+    writer across all workers, whatever the size of the files. Otherwise
+    rows are streamed from each file in this process.
+
+    Args:
+        pending_files (list): (channel_name, file_path, ...) tuples.
+        workers (int): Number of parse processes (0 parses in this process).
+        queue_size (int): Maximum number of parsed row chunks waiting for the writer.
+        chunk_size (int): Rows per chunk.
+    """
+    if workers <= 0:
+        for pending_file in pending_files:
+            yield pending_file, serialize_file(pending_file[0], pending_file[1])
+        return
+
+    chunks_per_file = max(1, queue_size // workers)
+    with Manager() as manager, ProcessPoolExecutor(max_workers=workers) as pool:
+        queued = deque()
+        pending = iter(pending_files)
+        try:
+            while True:
+                # Only as many files as there are workers are in flight, each with its own bounded queue
+                for pending_file in islice(pending, workers - len(queued)):
+                    chunks = manager.Queue(maxsize=chunks_per_file)
+                    future = pool.submit(parse_file, pending_file[0], pending_file[1], chunks, chunk_size)
+                    queued.append((pending_file, chunks, future))
+                if not queued:
+                    break
+                pending_file, chunks, future = queued[0]
+                yield pending_file, _iter_chunks(chunks, future)
+                queued.popleft()
+        finally:
+            # Queues of workers still parsing are drained, so none stays blocked on a full queue at shutdown
+            for _, chunks, future in queued:
+                future.cancel()
+                while not future.done():
+                    try:
+                        chunks.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+
+def load_rows(cur, rows, method: str = LOAD_METHOD, batch_size: int = LOAD_BATCH_SIZE, partitioned: bool = False):
+    """
+    Loads the rows of one lake file: stages them (COPY or INSERT) and upserts them into raw.raw_messages.
+
+    Returns:
+        int: The number of rows staged.
+    """
+    row_count = write_rows(cur, rows, method=method, batch_size=batch_size)
+    merge_stage_table(cur, partitioned)
+    return row_count
+
+def record_manifest(cur, file_path: str, file_size: int, file_mtime: float, file_sha256_value: str, row_count: int):
+    """Records (or updates) a loaded lake file in the manifest."""
+    cur.execute("""
+        INSERT INTO raw.raw_messages_manifest (file_path, file_size, file_mtime, file_sha256, row_count)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (file_path) DO UPDATE
+            SET file_size = EXCLUDED.file_size, file_mtime = EXCLUDED.file_mtime,
+                file_sha256 = EXCLUDED.file_sha256, row_count = EXCLUDED.row_count, loaded_at = NOW();
+    """, (file_path, file_size, file_mtime, file_sha256_value, row_count))
+
+def load_data_to_postgres(mode: str = LOAD_MODE, since_date: str = None, method: str = LOAD_METHOD,
+                          batch_size: int = LOAD_BATCH_SIZE, workers: int = LOAD_PARSE_WORKERS,
+                          queue_size: int = LOAD_QUEUE_SIZE, drop_before: str = None):
     """
     Loads raw JSON data from the data lake into a 'raw_messages' table
     in the 'raw' schema of the PostgreSQL database.
+
+    Args:
+        mode (str): 'incremental' loads only lake files that are new or changed since they were
+            last loaded (by size, mtime and hash) and commits after each file, so the table stays
+            queryable. 'full' truncates the table and reloads the whole lake in one transaction.
+        since_date (str, optional): Watermark date ('YYYY-MM-DD'). When given, messages from this
+            day onwards are deleted and their lake partitions reloaded, whatever the manifest says.
+        method (str): 'copy' for batched COPY (falls back to INSERT per batch on error) or 'insert'.
+        batch_size (int): Rows sent to PostgreSQL per batch.
+        workers (int): Processes that parse lake files in parallel with the database writes
+            (0 parses in this process).
+        queue_size (int): Parsed row chunks (of batch_size rows) kept in memory ahead of the writer when workers > 0.
+        drop_before (str, optional): Retention date ('YYYY-MM-DD'). Messages older than this are removed,
+            by dropping whole monthly partitions when the table is partitioned.
     """
     conn = get_db_connection()
     if not conn:
@@ -52,52 +604,86 @@ def load_data_to_postgres():
 
     try:
         with conn.cursor() as cur:
-            # Create a schema for our raw data if it doesn't exist
-            cur.execute("CREATE SCHEMA IF NOT EXISTS raw;")
-            # Create the table to hold the raw JSON data
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS raw.raw_messages (
-                    id SERIAL PRIMARY KEY,
-                    channel_name VARCHAR(255),
-                    message_data JSONB,
-                    loaded_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
-                );
-            """)
-            logging.info("Schema 'raw' and table 'raw_messages' are ready.")
+            partitioned = ensure_tables(cur)
+            create_stage_table(cur)
+            if drop_before:
+                if partitioned:
+                    drop_partitions_before(cur, drop_before)
+                else:
+                    logging.info(f"Deleting messages dated before {drop_before} from raw.raw_messages.")
+                    cur.execute("DELETE FROM raw.raw_messages WHERE message_date < %s::date;", (drop_before,))
+            conn.commit()
 
-            # --- NEW: Truncate the table to avoid duplicate data on re-runs ---
-            logging.info("Truncating raw.raw_messages to prepare for new data load.")
-            cur.execute("TRUNCATE TABLE raw.raw_messages RESTART IDENTITY;")
+            lake_path = PARQUET_LAKE_PATH if LAKE_FORMAT == 'parquet' else DATA_LAKE_PATH
+            if not os.path.exists(lake_path):
+                logging.warning(f"Data lake path not found: {lake_path}. Skipping data loading.")
+                return
 
+            # A full reload always reads the whole lake
+            lake_files = list_lake_files(None if mode == 'full' else since_date)
+            if mode == 'full':
+                logging.info("Truncating raw.raw_messages to prepare for a full reload.")
+                cur.execute("TRUNCATE TABLE raw.raw_messages RESTART IDENTITY;")
+                cur.execute("TRUNCATE TABLE raw.raw_messages_manifest;")
+            elif since_date:
+                # Only the days from the watermark onwards are replaced
+                logging.info(f"Deleting messages dated {since_date} or later from raw.raw_messages.")
+                cur.execute(
+                    "DELETE FROM raw.raw_messages WHERE message_date >= %s::date;",
+                    (since_date,)
+                )
+                cur.execute(
+                    "DELETE FROM raw.raw_messages_manifest WHERE file_path = ANY(%s);",
+                    ([file_path for _, file_path in lake_files],)
+                )
+                conn.commit()
 
-            # Iterate through the partitioned data lake directories
-            if not os.path.exists(DATA_LAKE_PATH):
-                logging.warning(f"Data lake path not found: {DATA_LAKE_PATH}. Skipping data loading.")
-                return
-                
-            for date_folder in os.listdir(DATA_LAKE_PATH):
-                date_path = os.path.join(DATA_LAKE_PATH, date_folder)
-                if not os.path.isdir(date_path):
+            cur.execute("SELECT file_path, file_size, file_mtime, file_sha256 FROM raw.raw_messages_manifest;")
+            manifest = {row[0]: row[1:] for row in cur.fetchall()}
+
+            started = time.perf_counter()
+            pending_files = []
+            for channel_name, file_path in lake_files:
+                stat = os.stat(file_path)
+                loaded = manifest.get(file_path)
+                if loaded and loaded[0] == stat.st_size and loaded[1] == stat.st_mtime:
                     continue
 
-                for json_file in os.listdir(date_path):
-                    if not json_file.endswith('.json'):
-                        continue
-                    
-                    channel_name = json_file.replace('.json', '')
-                    file_path = os.path.join(date_path, json_file)
-
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        messages = json.load(f)
-                        for message in messages:
-                            # Insert each message as a new row with its JSON content
-                            cur.execute(
-                                "INSERT INTO raw.raw_messages (channel_name, message_data) VALUES (%s, %s);",
-                                (channel_name, Json(message))
-                            )
-        
+                # Size or mtime changed: only reload if the content really changed
+                file_hash = file_sha256(file_path)
+                if loaded and loaded[2] == file_hash:
+                    cur.execute(
+                        "UPDATE raw.raw_messages_manifest SET file_size = %s, file_mtime = %s WHERE file_path = %s;",
+                        (stat.st_size, stat.st_mtime, file_path)
+                    )
+                else:
+                    pending_files.append((channel_name, file_path, stat.st_size, stat.st_mtime, file_hash))
+            if mode == 'incremental':
+                conn.commit()
+
+            row_count = 0
+            for pending_file, rows in iter_parsed_files(pending_files, workers=workers, queue_size=queue_size,
+                                                         chunk_size=batch_size):
+                channel_name, file_path, file_size, file_mtime, file_hash = pending_file
+                file_rows = load_rows(cur, rows, method=method, batch_size=batch_size, partitioned=partitioned)
+                record_manifest(cur, file_path, file_size, file_mtime, file_hash, file_rows)
+                row_count += file_rows
+                logging.info(f"Loaded {file_rows} messages from {file_path}.")
+
+                if mode == 'incremental':
+                    # Each file is committed with its manifest entry, so a crash never loses or repeats work
+                    conn.commit()
+
+            if pending_files or mode == 'full' or since_date or drop_before:
+                bump_data_version(cur, 'loader')
             conn.commit()
-            logging.info("Successfully loaded all JSON files into raw.raw_messages.")
+
+            seconds = time.perf_counter() - started
+            logging.info(
+                f"Successfully loaded {row_count} messages from {len(pending_files)} of {len(lake_files)} lake files "
+                f"into raw.raw_messages in {seconds:.1f} seconds ({row_count / max(seconds, 1e-9):.0f} rows/s, "
+                f"mode={mode}, method={method}, batch_size={batch_size}, workers={workers})."
+            )
 
     except Exception as e:
         logging.error(f"An error occurred during data loading: {e}")
@@ -105,3 +691,18 @@ def load_data_to_postgres():
     finally:
         conn.close()
         logging.info("Database connection closed.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load the raw data lake into raw.raw_messages.")
+    parser.add_argument('--mode', choices=['incremental', 'full'], default=LOAD_MODE)
+    parser.add_argument('--since', dest='since_date', help="Reload messages dated on or after this day (YYYY-MM-DD).")
+    parser.add_argument('--method', choices=['copy', 'insert'], default=LOAD_METHOD)
+    parser.add_argument('--batch-size', type=int, default=LOAD_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=LOAD_PARSE_WORKERS, help="Parse processes (0 parses in the loader process).")
+    parser.add_argument('--queue-size', type=int, default=LOAD_QUEUE_SIZE, help="Parsed row chunks (of --batch-size rows) held ahead of the database writer.")
+    parser.add_argument('--drop-before', help="Remove messages dated before this day (YYYY-MM-DD); drops whole months when partitioned.")
+    args = parser.parse_args()
+
+    load_data_to_postgres(mode=args.mode, since_date=args.since_date, method=args.method, batch_size=args.batch_size,
+                          workers=args.workers, queue_size=args.queue_size, drop_before=args.drop_before)
@@ -5,12 +5,15 @@ import asyncio
 from dotenv import load_dotenv
 from telethon import TelegramClient
 from scraping.scraper import scrape_all_channels
+from scraping.fake_client import FakeTelegramClient
 from loading.loader import load_data_to_postgres
 
 # Load environment variables
 load_dotenv()
 API_ID = os.getenv("TELEGRAM_API_ID")
 API_HASH = os.getenv("TELEGRAM_API_HASH")
+# Set to 1 to scrape synthetic channels offline instead of using the 'anon' session
+USE_FAKE_TELEGRAM = os.getenv("USE_FAKE_TELEGRAM", "0") == "1"
 
 async def main():
     """
@@ -20,12 +23,15 @@ async def main():
 
     # # --- Task 1: Data Scraping (Commented out for faster testing) ---
 
-    client = TelegramClient('anon', API_ID, API_HASH)
+    if USE_FAKE_TELEGRAM:
+        client = FakeTelegramClient()
+    else:
+        client = TelegramClient('anon', API_ID, API_HASH)
     async with client:
         me = await client.get_me()
         print(f"✅ Logged in as: {me.first_name}")
         print("--- Running Task 1: Data Scraping and Collection ---")
-        await scrape_all_channels(client)
+        await scrape_all_channels(client, channels=client.channels if USE_FAKE_TELEGRAM else None)
         print("✅ Task 1 complete.")
 
 
@@ -40,6 +46,8 @@ async def main():
     # Step 2: Run dbt to transform the data
     print("Running dbt transformations...")
     # The --profiles-dir flag is no longer needed
+    # Seeds (e.g. the product dictionary) are loaded first, as the marts read them
+    os.system("dbt seed --project-dir ./dbt_project")
     dbt_command = "dbt run --project-dir ./dbt_project"
     os.system(dbt_command)
     print("✅ dbt transformations complete.")
@@ -3,6 +3,12 @@
 import subprocess
 import os
 from dagster import op, OpExecutionContext
+from enrichment.job_queue import JobQueue, worker_is_alive, ENRICHMENT_QUEUE_FILE, WORKER_STATUS_FILE
+
+# 'auto' hands enrichment to a running enrichment worker and falls back to a subprocess without one,
+# 'worker' always queues a job (waiting for a worker to pick it up), 'subprocess' always starts the script.
+ENRICHMENT_MODE = os.getenv("ENRICHMENT_MODE", "auto")
+ENRICHMENT_JOB_TIMEOUT = int(os.getenv("ENRICHMENT_JOB_TIMEOUT", 3600)) # Seconds to wait for a queued job
 
 # An op is a single unit of computation in a Dagster pipeline.
 # Each function decorated with @op represents one step.
@@ -39,14 +45,32 @@ def run_yolo_enrichment(context: OpExecutionContext, scrape_success: bool):
         return False
         
     context.log.info("Starting image enrichment with YOLOv8...")
-    
+    project_root = os.getenv("DAGSTER_PROJECT_ROOT", ".")
+
+    # A running worker already has the model loaded, so only a job has to be submitted
+    worker_alive = worker_is_alive(os.path.join(project_root, WORKER_STATUS_FILE))
+    if ENRICHMENT_MODE == "worker" or (ENRICHMENT_MODE == "auto" and worker_alive):
+        queue = JobQueue(os.path.join(project_root, ENRICHMENT_QUEUE_FILE))
+        try:
+            job_id = queue.submit(source="dagster")
+            context.log.info(f"Submitted enrichment job {job_id} to the enrichment worker.")
+            job = queue.wait(job_id, timeout=ENRICHMENT_JOB_TIMEOUT)
+        finally:
+            queue.close()
+        if job["status"] == "failed":
+            raise RuntimeError(f"Enrichment job {job_id} failed: {job['error']}")
+        context.log.info(f"Enrichment job {job_id} processed {job['processed']} image(s).")
+        return True
+    context.log.info("No enrichment worker is running. Starting the enrichment script instead.")
+
     # We use subprocess to run your existing enrichment script.
-    # We assume it's executable and located at 'src/enrichment/enrich_images.py'.
-    command = ["python", "src/enrichment/enrich_images.py"]
+    # It runs as a module with 'src' as the import root, like every other script of the project.
+    command = ["python", "-m", "enrichment.enrich_images"]
+    env = {**os.environ, "PYTHONPATH": "src"}
     
     try:
         # We run the script from the root of the project.
-        process = subprocess.run(command, check=True, capture_output=True, text=True, cwd=os.getenv("DAGSTER_PROJECT_ROOT", "."))
+        process = subprocess.run(command, check=True, capture_output=True, text=True, cwd=os.getenv("DAGSTER_PROJECT_ROOT", "."), env=env)
         context.log.info("YOLO enrichment script output:\n" + process.stdout)
     except subprocess.CalledProcessError as e:
         context.log.error(f"YOLO enrichment failed with error:\n{e.stderr}")
@@ -71,16 +95,17 @@ def load_raw_to_postgres(context: OpExecutionContext, scrape_success: bool, enri
     # Define the loading scripts to be executed
     # We assume you have a loading script for messages.
     loading_scripts = [
-        "src/loading/loader.py", # Assumed script for messages
-        "src/loading/load_detection_results.py"
+        "loading.loader", # Script for messages
+        "loading.load_detection_results"
     ]
     
     for script_path in loading_scripts:
         context.log.info(f"Running loading script: {script_path}")
-        command = ["python", script_path]
+        command = ["python", "-m", script_path]
         try:
             # We use docker-compose run to ensure the script has network access to the 'db' container.
-            # This uses the 'app' service which has all python dependencies installed.
+            # This uses the 'app' service which has all python dependencies installed
+            # (its image sets PYTHONPATH=/app/src, the import root of the project's modules).
             docker_command = ["docker-compose", "run", "--rm", "app"] + command
             process = subprocess.run(docker_command, check=True, capture_output=True, text=True, cwd=os.getenv("DAGSTER_PROJECT_ROOT", "."))
             context.log.info(f"Output from {script_path}:\n" + process.stdout)
@@ -105,12 +130,14 @@ def run_dbt_transformations(context: OpExecutionContext, load_success: bool):
     context.log.info("Starting dbt transformations...")
     
     # This is the same command you used successfully in the terminal.
-    # It runs 'dbt run' inside the dbt service container.
-    command = ["docker-compose", "run", "--rm", "dbt", "run"]
+    # It runs 'dbt seed' (reference data such as the product dictionary) and then
+    # 'dbt run' inside the dbt service container.
+    commands = [["docker-compose", "run", "--rm", "dbt", "seed"], ["docker-compose", "run", "--rm", "dbt", "run"]]
     
     try:
-        process = subprocess.run(command, check=True, capture_output=True, text=True, cwd=os.getenv("DAGSTER_PROJECT_ROOT", "."))
-        context.log.info("dbt run output:\n" + process.stdout)
+        for command in commands:
+            process = subprocess.run(command, check=True, capture_output=True, text=True, cwd=os.getenv("DAGSTER_PROJECT_ROOT", "."))
+            context.log.info(f"dbt {command[-1]} output:\n" + process.stdout)
     except subprocess.CalledProcessError as e:
         context.log.error(f"dbt transformations failed with error:\n{e.stderr}")
         raise e
@@ -0,0 +1,67 @@
+# This file contains the persistent per-channel checkpoint store used for incremental scraping.
+
+import os
+import json
+import logging
+from datetime import datetime, timezone
+
+CHECKPOINT_PATH = os.getenv("SCRAPE_CHECKPOINT_PATH", 'data/raw/scrape_checkpoints.json')
+
+
+class CheckpointStore:
+    """
+    Keeps the high-water marks of every scraped channel in a small JSON file.
+
+    For each channel it records the newest message seen (used as `min_id` on
+    the next incremental run) and the oldest message seen (used as `offset_id`
+    when backfilling older history).
+    """
+
+    def __init__(self, path: str = CHECKPOINT_PATH):
+        self.path = path
+        self._checkpoints = self._load()
+
+    def _load(self):
+        """Reads the checkpoint file, starting fresh if it is missing or unreadable."""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, json.JSONDecodeError) as e:
+            logging.warning(f"Could not read checkpoint file {self.path}. Starting fresh. Error: {e}")
+            return {}
+
+    def get(self, channel_name: str):
+        """Returns the checkpoint dictionary for a channel, or None if it was never scraped."""
+        return self._checkpoints.get(channel_name)
+
+    def update(self, channel_name: str, newest=None, oldest=None, reached_start: bool = False):
+        """
+        Moves the channel's high-water marks outwards. Marks never move backwards,
+        so a retried or partial run cannot lose progress.
+
+        Args:
+            channel_name (str): The channel the messages belong to.
+            newest (tuple, optional): (message_id, date) of the newest message seen.
+            oldest (tuple, optional): (message_id, date) of the oldest message seen.
+            reached_start (bool): True once backfill has reached the first message of the channel.
+        """
+        checkpoint = self._checkpoints.setdefault(channel_name, {})
+        if newest and newest[0] > checkpoint.get('last_message_id', 0):
+            checkpoint['last_message_id'] = newest[0]
+            checkpoint['last_message_date'] = newest[1].isoformat()
+        if oldest and oldest[0] < checkpoint.get('oldest_message_id', float('inf')):
+            checkpoint['oldest_message_id'] = oldest[0]
+            checkpoint['oldest_message_date'] = oldest[1].isoformat()
+        if reached_start:
+            checkpoint['reached_start'] = True
+        checkpoint['updated_at'] = datetime.now(timezone.utc).isoformat()
+
+    def save(self):
+        """Writes all checkpoints to disk atomically (write to a temp file, then rename)."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._checkpoints, f, indent=4)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,158 @@
+# This file contains the background photo download queue used by the scraper.
+
+import asyncio
+import logging
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError
+from scraping.rate_limiter import TokenBucketLimiter
+from scraping.image_store import ImageStore
+
+
+def estimate_photo_size(photo):
+    """
+    Returns the size in bytes of the largest version of a Telegram photo,
+    which is the one `download_media` fetches. Returns 0 if it is unknown.
+    """
+    largest = 0
+    for size in getattr(photo, 'sizes', None) or []:
+        if getattr(size, 'size', None):
+            largest = max(largest, size.size)
+        elif getattr(size, 'sizes', None): # PhotoSizeProgressive lists cumulative sizes
+            largest = max(largest, max(size.sizes))
+    return largest
+
+
+class _ByteBudget:
+    """Limits the total number of bytes being downloaded at the same time."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, size: int):
+        """Waits until `size` bytes fit in the budget. A single oversized photo is still allowed alone."""
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: self.in_flight == 0 or self.in_flight + size <= self.max_bytes
+            )
+            self.in_flight += size
+
+    async def release(self, size: int):
+        async with self._condition:
+            self.in_flight -= size
+            self._condition.notify_all()
+
+
+class PhotoDownloader:
+    """
+    A bounded pool of workers that download photos in the background.
+
+    `submit()` queues a photo and immediately returns a future, so message
+    paging can continue while the download happens. Photos already in the
+    image store (or already queued) are not downloaded again. The queue size bounds the
+    number of pending photos, and a byte budget bounds the bytes in flight.
+    Failed downloads are retried with exponential backoff, and FloodWait
+    errors are passed to the shared rate limiter.
+    """
+
+    def __init__(self, client: TelegramClient, limiter: TokenBucketLimiter, store: ImageStore, workers: int = 4,
+                 queue_size: int = 100, max_bytes_in_flight: int = 50 * 1024 * 1024,
+                 max_retries: int = 3, backoff_seconds: float = 1.0):
+        """
+        Args:
+            client (TelegramClient): An authenticated Telethon client instance.
+            limiter (TokenBucketLimiter): The rate limiter shared with message paging.
+            store (ImageStore): The content-addressed store the photos are saved into.
+            workers (int): Number of downloads running in parallel.
+            queue_size (int): Maximum number of photos waiting to be downloaded.
+            max_bytes_in_flight (int): Maximum total size of the photos being downloaded at once.
+            max_retries (int): Retries per photo after a failed download.
+            backoff_seconds (float): Base delay of the exponential backoff between retries.
+        """
+        self.client = client
+        self.limiter = limiter
+        self.store = store
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._budget = _ByteBudget(max_bytes_in_flight)
+        self._tasks = []
+        self._in_flight = {} # photo id -> future, so a photo queued twice is downloaded once
+
+    def start(self):
+        """Starts the worker tasks. Must be called from inside the running event loop."""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, photo):
+        """
+        Queues a photo for download. Waits only if the queue is full.
+
+        Args:
+            photo: The Telethon photo object of the message.
+
+        Returns:
+            asyncio.Future: Resolves to the photo's image store entry, or None if the download failed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        entry = self.store.lookup(photo.id)
+        if entry:
+            future.set_result(entry)
+            return future
+        if photo.id in self._in_flight:
+            return self._in_flight[photo.id]
+
+        self._in_flight[photo.id] = future
+        await self._queue.put((photo, future))
+        return future
+
+    async def close(self):
+        """Waits for all queued downloads to finish, then stops the workers."""
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            photo, future = await self._queue.get()
+            size = estimate_photo_size(photo)
+            await self._budget.acquire(size)
+            entry = None
+            try:
+                content = await self._download_with_retries(photo)
+                entry = self.store.put(photo.id, content) if content else None
+            except Exception as e:
+                # E.g. a full disk; the photo counts as failed and the worker moves on to the next one
+                logging.error(f"Could not store photo {photo.id}: {e}")
+            finally:
+                if not future.done():
+                    future.set_result(entry)
+                self._in_flight.pop(photo.id, None)
+                await self._budget.release(size)
+                self._queue.task_done()
+
+    async def _download_with_retries(self, photo):
+        """Downloads a photo into memory and returns its bytes, or None if every attempt failed."""
+        for attempt in range(1, self.max_retries + 2):
+            await self.limiter.acquire()
+            try:
+                content = await self.client.download_media(photo, file=bytes)
+                logging.info(f"Downloaded photo {photo.id} ({len(content)} bytes).")
+                return content
+            except FloodWaitError as e:
+                # The limiter already makes every request wait, so no extra backoff is needed
+                self.limiter.penalize(e.seconds)
+                error, delay = e, 0
+            except Exception as e:
+                error, delay = e, self.backoff_seconds * 2 ** (attempt - 1)
+
+            if attempt > self.max_retries:
+                break
+            logging.warning(f"Download of photo {photo.id} failed (attempt {attempt}): {error}. Retrying in {delay:.1f} seconds.")
+            await asyncio.sleep(delay)
+
+        logging.error(f"Giving up on photo {photo.id} after {self.max_retries + 1} attempts: {error}")
+        return None
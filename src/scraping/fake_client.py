@@ -0,0 +1,131 @@
+# This file contains an offline stand-in for the Telethon client, used for benchmarks and local runs.
+
+import os
+import random
+import asyncio
+from datetime import datetime, timedelta, timezone
+from telethon.errors import FloodWaitError
+from telethon.tl import types
+
+HISTORY_PAGE_SIZE = 100 # Messages returned per simulated history request, like Telegram's GetHistory
+
+
+class FakeTelegramClient:
+    """
+    Simulates the parts of `TelegramClient` used by the scraper: `get_me`,
+    `get_entity`, `iter_messages` and `download_media`.
+
+    Every channel has `messages_per_channel` synthetic messages (ids 1..N,
+    newest first), a share of which carry a photo. Each simulated request
+    waits `latency` seconds, and every `flood_wait_every`-th request raises a
+    FloodWaitError, so rate limiting and retries can be exercised offline.
+    """
+
+    def __init__(self, channels=None, messages_per_channel: int = 1000, photo_ratio: float = 0.3,
+                 photo_size: int = 64 * 1024, latency: float = 0.0, download_latency: float = 0.0,
+                 flood_wait_every: int = 0, flood_wait_seconds: int = 1, seed: int = 42):
+        """
+        Args:
+            channels (list, optional): Channel usernames. Defaults to three synthetic channels.
+            messages_per_channel (int): Number of messages in every channel.
+            photo_ratio (float): Share of messages (0..1) that carry a photo.
+            photo_size (int): Size in bytes of every synthetic photo.
+            latency (float): Seconds every API request (entity, history page) takes.
+            download_latency (float): Seconds every photo download takes.
+            flood_wait_every (int): Raise a FloodWaitError on every N-th request (0 disables it).
+            flood_wait_seconds (int): The wait time reported by injected FloodWait errors.
+            seed (int): Seed for the photo assignment, so runs are reproducible.
+        """
+        self.channels = channels or ['fake_channel_1', 'fake_channel_2', 'fake_channel_3']
+        self.messages_per_channel = messages_per_channel
+        self.photo_ratio = photo_ratio
+        self.photo_size = photo_size
+        self.latency = latency
+        self.download_latency = download_latency
+        self.flood_wait_every = flood_wait_every
+        self.flood_wait_seconds = flood_wait_seconds
+        self.seed = seed
+
+        # Attributes the scraper or Telethon's message objects read from a real client
+        self.parse_mode = None
+        self.flood_sleep_threshold = 60
+
+        self.request_count = 0
+        self.flood_waits_raised = 0
+        self.photos_downloaded = 0
+        self._base_date = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def _request(self, latency: float):
+        """Simulates one API round trip, raising a FloodWaitError when one is due."""
+        self.request_count += 1
+        if self.flood_wait_every and self.request_count % self.flood_wait_every == 0:
+            self.flood_waits_raised += 1
+            raise FloodWaitError(request=None, capture=self.flood_wait_seconds)
+        if latency:
+            await asyncio.sleep(latency)
+
+    async def get_me(self):
+        return types.User(id=1, first_name='Fake User', is_self=True)
+
+    async def get_entity(self, channel_name: str):
+        await self._request(self.latency)
+        if channel_name not in self.channels:
+            raise ValueError(f"No channel named '{channel_name}'")
+        return types.Channel(
+            id=self.channels.index(channel_name) + 1, title=channel_name, photo=types.ChatPhotoEmpty(),
+            date=self._base_date, username=channel_name
+        )
+
+    def _make_message(self, entity, message_id: int):
+        rng = random.Random(f"{self.seed}:{entity.id}:{message_id}")
+        media = None
+        if rng.random() < self.photo_ratio:
+            photo = types.Photo(
+                id=entity.id * 10_000_000 + message_id, access_hash=0, file_reference=b'',
+                date=self._base_date, dc_id=1,
+                sizes=[types.PhotoSize(type='y', w=1280, h=1280, size=self.photo_size)]
+            )
+            media = types.MessageMediaPhoto(photo=photo)
+
+        message = types.Message(
+            id=message_id, peer_id=types.PeerChannel(entity.id),
+            date=self._base_date + timedelta(minutes=10 * message_id),
+            message=f"Synthetic message {message_id} from {entity.username}. Paracetamol 500mg in stock.",
+            media=media, post=True
+        )
+        # Telethon fills in message.text through the client that fetched the message
+        message._client = self
+        return message
+
+    async def iter_messages(self, entity, limit=None, min_id: int = 0, offset_id: int = 0, **kwargs):
+        """Yields messages newest first, honouring `limit`, `min_id` and `offset_id` like Telethon."""
+        newest_id = offset_id - 1 if offset_id else self.messages_per_channel
+        yielded = 0
+        for message_id in range(newest_id, min_id, -1):
+            if limit is not None and yielded >= limit:
+                return
+            if yielded % HISTORY_PAGE_SIZE == 0:
+                await self._request(self.latency)
+            yield self._make_message(entity, message_id)
+            yielded += 1
+
+    async def download_media(self, media, file=None):
+        """Returns synthetic photo bytes, or writes them to `file` if it is a path."""
+        await self._request(self.download_latency)
+        photo = getattr(media, 'photo', media)
+        size = photo.sizes[-1].size
+        content = random.Random(photo.id).randbytes(size)
+        self.photos_downloaded += 1
+
+        if file is bytes:
+            return content
+        path = os.path.join(file, f"{photo.id}.jpg") if os.path.isdir(file) else file
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
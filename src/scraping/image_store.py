@@ -0,0 +1,98 @@
+# This file contains the content-addressed image store used to dedupe photos across channels and runs.
+
+import os
+import json
+import hashlib
+import logging
+
+# The scraper writes the store and the enrichment stage reads it, so both import this setting
+IMAGE_STORE_PATH = os.getenv("IMAGE_STORE_PATH", 'data/raw/images/store')
+PHOTO_INDEX_FILE = 'photo_index.jsonl' # Telegram photo id -> content hash
+REFERENCES_FILE = 'refs.jsonl' # content hash -> (channel, message id) of every post using it
+
+
+def stored_image_path(sha256: str, root: str = IMAGE_STORE_PATH):
+    """Returns where the store keeps the image with the given content hash."""
+    return os.path.join(root, sha256[:2], f"{sha256}.jpg")
+
+
+class ImageStore:
+    """
+    Stores every photo once, at `<root>/<sha256[:2]>/<sha256>.jpg`.
+
+    Two append-only index files sit next to the images:
+    - `photo_index.jsonl` maps Telegram photo ids to content hashes, so a
+      photo that was already downloaded is never downloaded again.
+    - `refs.jsonl` lists which channel messages use which image, so the
+      enrichment stage can run inference once per unique image.
+    """
+
+    def __init__(self, root: str = IMAGE_STORE_PATH):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+        self._photo_index = self._load_photo_index()
+
+    def _load_photo_index(self):
+        """Reads the photo id index. Later lines win if a photo id appears twice."""
+        index = {}
+        index_path = os.path.join(self.root, PHOTO_INDEX_FILE)
+        if not os.path.exists(index_path):
+            return index
+        with open(index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # A partially written last line from an interrupted run
+                index[entry['photo_id']] = entry
+        logging.info(f"Loaded {len(index)} stored photos from {index_path}.")
+        return index
+
+    def _append(self, filename: str, record: dict):
+        with open(os.path.join(self.root, filename), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def path_for(self, sha256: str):
+        """Returns the store path of an image with the given content hash."""
+        return stored_image_path(sha256, self.root)
+
+    def lookup(self, photo_id: int):
+        """Returns the store entry of a Telegram photo, or None if it was never downloaded."""
+        entry = self._photo_index.get(photo_id)
+        if entry and os.path.exists(entry['photo_path']):
+            return entry
+        return None
+
+    def put(self, photo_id: int, content: bytes):
+        """
+        Adds downloaded photo bytes to the store. Identical content that was
+        already stored under another photo id is not written again.
+
+        Args:
+            photo_id (int): Telegram's id of the photo.
+            content (bytes): The downloaded image.
+
+        Returns:
+            dict: The store entry with 'photo_id', 'photo_sha256' and 'photo_path'.
+        """
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = self.path_for(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+
+        entry = {'photo_id': photo_id, 'photo_sha256': sha256, 'photo_path': path}
+        self._photo_index[photo_id] = entry
+        self._append(PHOTO_INDEX_FILE, entry)
+        return entry
+
+    def add_reference(self, entry: dict, channel_name: str, message_id: int):
+        """Records that a channel message uses a stored image."""
+        self._append(REFERENCES_FILE, {
+            'photo_sha256': entry['photo_sha256'],
+            'channel_name': channel_name,
+            'message_id': message_id,
+        })
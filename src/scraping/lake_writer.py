@@ -0,0 +1,162 @@
+# This file contains the streaming NDJSON writer for the raw data lake.
+
+import os
+import json
+import glob
+import uuid
+import heapq
+import logging
+from collections import OrderedDict
+from loading.json_stream import iter_json_array
+
+DATA_LAKE_PATH = 'data/raw/telegram_messages'
+LAKE_FLUSH_EVERY = int(os.getenv("LAKE_FLUSH_EVERY", 100)) # Records written before the staging files are flushed
+LAKE_MAX_OPEN_FILES = int(os.getenv("LAKE_MAX_OPEN_FILES", 32)) # Staging files kept open at the same time
+
+
+class NdjsonLakeWriter:
+    """
+    Streams messages into newline-delimited JSON partitions at
+    `<root>/<date>/<channel>.jsonl` without keeping them in memory.
+
+    Records are appended to a staging file per partition (`.jsonl.<run>.part`)
+    as they arrive, flushed every `flush_every` records. `close()` merges each
+    staging file into its partition by message id and swaps the result in with
+    an atomic rename, so readers never see a half-written partition and
+    earlier runs are never overwritten.
+    """
+
+    def __init__(self, root: str = DATA_LAKE_PATH, flush_every: int = LAKE_FLUSH_EVERY,
+                 max_open_files: int = LAKE_MAX_OPEN_FILES):
+        self.root = root
+        self.flush_every = flush_every
+        self.max_open_files = max_open_files
+        self.run_id = uuid.uuid4().hex[:12]
+        self._open_files = OrderedDict() # partition -> file handle, least recently used first
+        self._touched = set()
+        self._unflushed = 0
+
+    def _partition_path(self, date_str: str, channel_name: str):
+        return os.path.join(self.root, date_str, f"{channel_name}.jsonl")
+
+    def _staging_file(self, partition):
+        """Returns the open staging file of a partition, closing the least recently used one if needed."""
+        handle = self._open_files.get(partition)
+        if handle:
+            self._open_files.move_to_end(partition)
+            return handle
+
+        if len(self._open_files) >= self.max_open_files:
+            _, oldest = self._open_files.popitem(last=False)
+            oldest.close()
+
+        date_str, channel_name = partition
+        os.makedirs(os.path.join(self.root, date_str), exist_ok=True)
+        staging_path = f"{self._partition_path(date_str, channel_name)}.{self.run_id}.part"
+        handle = open(staging_path, 'a', encoding='utf-8')
+        self._open_files[partition] = handle
+        self._touched.add(partition)
+        return handle
+
+    def write(self, date_str: str, channel_name: str, record: dict):
+        """Appends one message record to the staging file of its partition."""
+        self._staging_file((date_str, channel_name)).write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Flushes every open staging file to disk."""
+        for handle in self._open_files.values():
+            handle.flush()
+        self._unflushed = 0
+
+    def close(self):
+        """
+        Merges every partition written by this writer and removes the staging files.
+
+        Returns:
+            dict: Partition path -> number of messages in the merged partition.
+        """
+        for handle in self._open_files.values():
+            handle.close()
+        self._open_files.clear()
+
+        saved = {}
+        for date_str, channel_name in sorted(self._touched):
+            path = self._partition_path(date_str, channel_name)
+            saved[path] = merge_partition(path)
+            logging.info(f"Saved {saved[path]} messages to {path}")
+        self._touched.clear()
+        return saved
+
+
+def _read_lines(path: str):
+    """Yields (message_id, line) for every complete line of an NDJSON file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)['id'], line.rstrip('\n')
+            except (json.JSONDecodeError, KeyError):
+                continue # A partially written last line from an interrupted run
+
+def merge_partition(path: str):
+    """
+    Merges a partition with its staging files (including ones left behind by an
+    interrupted run) and with a legacy pretty-printed `.json` file of the same
+    partition. Records are deduplicated by message id, newest write winning.
+
+    Only the staged records (and a legacy file, converted once) are held in
+    memory. The existing partition, kept sorted by message id, is streamed
+    and merged with them, so memory grows with the batch, not the partition.
+
+    Returns:
+        int: The number of messages in the merged partition.
+    """
+    legacy_path = f"{os.path.splitext(path)[0]}.json"
+    staging_paths = sorted(glob.glob(f"{glob.escape(path)}.*.part"), key=os.path.getmtime)
+
+    # Only the raw lines are kept, keyed by message id, to avoid holding parsed objects
+    staged = {}
+    if os.path.exists(legacy_path):
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            for message in iter_json_array(f):
+                staged[message['id']] = json.dumps(message, ensure_ascii=False)
+    for staging_path in staging_paths:
+        staged.update(_read_lines(staging_path))
+
+    existing = (
+        (message_id, line) for message_id, line in _read_lines(path) if message_id not in staged
+    ) if os.path.exists(path) else iter(())
+    merged = heapq.merge(existing, sorted(staged.items(), reverse=True), key=lambda record: record[0], reverse=True)
+
+    count = 0
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for _, line in merged:
+            f.write(line + '\n')
+            count += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    for staging_path in staging_paths:
+        os.remove(staging_path)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+    return count
+
+def merge_staged_partitions(root: str = DATA_LAKE_PATH):
+    """
+    Merges the partitions that still have staging files, e.g. from a backfill
+    that was interrupted after checkpointing chunks it had not merged yet.
+    Must run before any writer of this run starts staging.
+
+    Returns:
+        int: The number of partitions merged.
+    """
+    paths = sorted({staging_path.rsplit('.', 2)[0] for staging_path in glob.glob(os.path.join(root, '*', '*.jsonl.*.part'))})
+    for path in paths:
+        logging.info(f"Merging staged messages left by an earlier run into {path}.")
+        merge_partition(path)
+    return len(paths)
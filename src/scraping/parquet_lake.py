@@ -0,0 +1,254 @@
+# This file contains the optional columnar (Parquet) storage mode of the raw data lake.
+#
+# Layout: <root>/message_date=<YYYY-MM-DD>/channel_name=<channel>/part-<run>-<n>.parquet
+#
+# Usage (compaction):
+#   PYTHONPATH=src python -m scraping.parquet_lake compact [--since 2024-01-01] [--min-files 2]
+
+import os
+import glob
+import uuid
+import logging
+import argparse
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # pyarrow is only needed when LAKE_FORMAT=parquet
+    pa = None
+    pq = None
+
+PARQUET_LAKE_PATH = os.getenv("PARQUET_LAKE_PATH", 'data/raw/telegram_messages_parquet')
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", 'zstd')
+PARQUET_ROWS_PER_FILE = int(os.getenv("PARQUET_ROWS_PER_FILE", 50000)) # Rows buffered per partition before a part file is written
+PARQUET_MAX_BUFFERED_ROWS = int(os.getenv("PARQUET_MAX_BUFFERED_ROWS", 200000)) # Rows buffered across all partitions
+
+# Column name -> Arrow type. Kept in the same order as the message dictionaries written by the scraper.
+MESSAGE_COLUMNS = {
+    'id': 'int64',
+    'date': 'string',
+    'text': 'string',
+    'sender_id': 'int64',
+    'photo_id': 'int64',
+    'photo_sha256': 'string',
+    'photo_path': 'string',
+}
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("The Parquet lake requires 'pyarrow'. Install it with: pip install pyarrow")
+
+def _message_schema():
+    return pa.schema([(name, getattr(pa, type_name)()) for name, type_name in MESSAGE_COLUMNS.items()])
+
+def partition_dir(root: str, date_str: str, channel_name: str):
+    """Returns the directory holding the part files of one date and channel."""
+    return os.path.join(root, f"message_date={date_str}", f"channel_name={channel_name}")
+
+def _write_table_atomically(table, path: str):
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path, compression=PARQUET_COMPRESSION)
+    os.replace(tmp_path, path)
+
+
+class ParquetLakeWriter:
+    """
+    Writes messages into compressed Parquet part files partitioned by date and
+    channel. Has the same interface as `NdjsonLakeWriter`.
+
+    Rows are buffered per partition and written as a new part file once a
+    partition holds `rows_per_file` rows, or when all buffers together exceed
+    `max_buffered_rows`. Part files are never modified; `compact_partitions`
+    later merges small ones and removes duplicate message ids.
+    """
+
+    def __init__(self, root: str = PARQUET_LAKE_PATH, rows_per_file: int = PARQUET_ROWS_PER_FILE,
+                 max_buffered_rows: int = PARQUET_MAX_BUFFERED_ROWS):
+        _require_pyarrow()
+        self.root = root
+        self.rows_per_file = rows_per_file
+        self.max_buffered_rows = max_buffered_rows
+        self.run_id = uuid.uuid4().hex[:12]
+        self._buffers = {} # (date_str, channel_name) -> list of records
+        self._buffered_rows = 0
+        self._files_written = 0
+
+    def write(self, date_str: str, channel_name: str, record: dict):
+        """Buffers one message record for its partition."""
+        partition = (date_str, channel_name)
+        buffer = self._buffers.setdefault(partition, [])
+        buffer.append(record)
+        self._buffered_rows += 1
+
+        if len(buffer) >= self.rows_per_file:
+            self._write_partition(partition)
+        elif self._buffered_rows >= self.max_buffered_rows:
+            # Free memory by writing out the largest buffer
+            self._write_partition(max(self._buffers, key=lambda key: len(self._buffers[key])))
+
+    def _write_partition(self, partition):
+        records = self._buffers.pop(partition, [])
+        if not records:
+            return
+        self._buffered_rows -= len(records)
+
+        directory = partition_dir(self.root, *partition)
+        os.makedirs(directory, exist_ok=True)
+        table = pa.Table.from_pylist(
+            [{name: record.get(name) for name in MESSAGE_COLUMNS} for record in records],
+            schema=_message_schema()
+        )
+        path = os.path.join(directory, f"part-{self.run_id}-{self._files_written:05d}.parquet")
+        _write_table_atomically(table, path)
+        self._files_written += 1
+        logging.info(f"Saved {len(records)} messages to {path}")
+
+    def flush(self):
+        """Writes every buffered partition to a part file."""
+        for partition in list(self._buffers):
+            self._write_partition(partition)
+
+    def close(self):
+        """Writes the remaining buffered rows."""
+        self.flush()
+
+
+def list_partitions(root: str = PARQUET_LAKE_PATH, since_date: str = None, until_date: str = None, channels=None):
+    """
+    Lists the partitions of the lake, pruned by date and channel using only
+    the directory names (no file is opened).
+
+    Args:
+        since_date (str, optional): Only dates on or after this day ('YYYY-MM-DD').
+        until_date (str, optional): Only dates on or before this day ('YYYY-MM-DD').
+        channels (list, optional): Only these channels.
+
+    Returns:
+        list: (date_str, channel_name, directory) tuples, sorted by date.
+    """
+    partitions = []
+    if not os.path.exists(root):
+        return partitions
+
+    for date_entry in sorted(os.listdir(root)):
+        if not date_entry.startswith('message_date='):
+            continue
+        date_str = date_entry.split('=', 1)[1]
+        if (since_date and date_str < since_date) or (until_date and date_str > until_date):
+            continue
+
+        date_path = os.path.join(root, date_entry)
+        for channel_entry in sorted(os.listdir(date_path)):
+            if not channel_entry.startswith('channel_name='):
+                continue
+            channel_name = channel_entry.split('=', 1)[1]
+            if channels and channel_name not in channels:
+                continue
+            partitions.append((date_str, channel_name, os.path.join(date_path, channel_entry)))
+    return partitions
+
+def _part_files(directory: str):
+    """Returns the part files of a partition, oldest first, so later writes win on duplicates."""
+    return sorted(glob.glob(os.path.join(directory, '*.parquet')), key=os.path.getmtime)
+
+def read_partition(directory: str, columns=None):
+    """
+    Reads one partition into an Arrow table with duplicate message ids removed
+    (the most recently written row wins).
+
+    Args:
+        directory (str): The partition directory.
+        columns (list, optional): Columns to read. 'id' is always read for deduplication.
+    """
+    _require_pyarrow()
+    read_columns = None if columns is None else list(dict.fromkeys(['id'] + list(columns)))
+    tables = [pq.read_table(path, columns=read_columns) for path in _part_files(directory)]
+    if not tables:
+        return None
+    table = pa.concat_tables(tables)
+
+    # Keep the last occurrence of each message id
+    last_row_by_id = {message_id: row for row, message_id in enumerate(table.column('id').to_pylist())}
+    if len(last_row_by_id) < table.num_rows:
+        table = table.take(sorted(last_row_by_id.values()))
+    if columns is not None:
+        table = table.select(list(columns))
+    return table
+
+def list_part_files(root: str = PARQUET_LAKE_PATH, since_date: str = None, until_date: str = None, channels=None):
+    """
+    Lists the part files of the matching partitions, oldest first within each
+    partition, so loading them in order lets later writes win.
+
+    Returns:
+        list: (channel_name, file_path) tuples.
+    """
+    return [
+        (channel_name, path)
+        for date_str, channel_name, directory in list_partitions(root, since_date, until_date, channels)
+        for path in _part_files(directory)
+    ]
+
+def read_part_file(path: str, columns=None):
+    """Yields the messages stored in a single part file as dictionaries."""
+    _require_pyarrow()
+    for batch in pq.ParquetFile(path).iter_batches(columns=columns):
+        yield from batch.to_pylist()
+
+def iter_messages(root: str = PARQUET_LAKE_PATH, since_date: str = None, until_date: str = None,
+                  channels=None, columns=None):
+    """
+    Yields (channel_name, message) pairs from the partitions that match the
+    date and channel filters, reading only the requested columns.
+    """
+    for date_str, channel_name, directory in list_partitions(root, since_date, until_date, channels):
+        table = read_partition(directory, columns)
+        if table is None:
+            continue
+        for batch in table.to_batches():
+            for message in batch.to_pylist():
+                yield channel_name, message
+
+def compact_partitions(root: str = PARQUET_LAKE_PATH, since_date: str = None, min_files: int = 2):
+    """
+    Merges the part files of every partition that has at least `min_files` of
+    them into a single file, removing duplicate message ids.
+
+    Returns:
+        int: The number of partitions compacted.
+    """
+    _require_pyarrow()
+    compacted = 0
+    for date_str, channel_name, directory in list_partitions(root, since_date=since_date):
+        part_files = _part_files(directory)
+        if len(part_files) < min_files:
+            continue
+
+        table = read_partition(directory)
+        table = table.sort_by([('id', 'descending')])
+        path = os.path.join(directory, f"part-compacted-{uuid.uuid4().hex[:12]}.parquet")
+        _write_table_atomically(table, path)
+        for part_file in part_files:
+            os.remove(part_file)
+
+        compacted += 1
+        logging.info(f"Compacted {len(part_files)} files into {path} ({table.num_rows} messages).")
+
+    logging.info(f"Compaction complete. Compacted {compacted} partition(s).")
+    return compacted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintenance commands for the Parquet data lake.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compact_parser = subparsers.add_parser('compact', help="Merge small part files within each partition.")
+    compact_parser.add_argument('--root', default=PARQUET_LAKE_PATH)
+    compact_parser.add_argument('--since', dest='since_date', help="Only compact dates on or after this day (YYYY-MM-DD).")
+    compact_parser.add_argument('--min-files', type=int, default=2, help="Compact partitions with at least this many files.")
+    args = parser.parse_args()
+
+    if args.command == 'compact':
+        compact_partitions(args.root, since_date=args.since_date, min_files=args.min_files)
@@ -0,0 +1,66 @@
+# This file contains the shared rate limiter used by all concurrent scraping tasks.
+
+import time
+import asyncio
+import logging
+
+
+class TokenBucketLimiter:
+    """
+    An asyncio token bucket shared by every task that talks to Telegram.
+
+    Tokens refill continuously at `rate` per second up to `capacity`. Each API
+    call takes one token. When Telegram answers with a FloodWait, `penalize()`
+    blocks every caller until the wait has passed instead of sleeping blindly.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        """
+        Args:
+            rate (float): Number of tokens added per second.
+            capacity (int): Maximum number of tokens the bucket can hold (burst size).
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        """Adds the tokens earned since the last refill."""
+        elapsed = max(0.0, now - self._last_refill)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._last_refill = now
+
+    async def acquire(self):
+        """Waits until a token is available (and no FloodWait is active), then takes it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                # Sleep just long enough for the next token to be available
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def penalize(self, seconds: float):
+        """
+        Blocks all callers for `seconds` after a FloodWait response and empties
+        the bucket so requests resume gradually once the wait is over.
+
+        Args:
+            seconds (float): The wait time requested by Telegram.
+        """
+        blocked_until = time.monotonic() + seconds
+        if blocked_until > self._blocked_until:
+            self._blocked_until = blocked_until
+            self._tokens = 0.0
+            self._last_refill = blocked_until
+            logging.warning(f"FloodWait received. Pausing all Telegram requests for {seconds} seconds.")
@@ -1,13 +1,21 @@
 # This file contains all the logic for scraping Telegram channels.
 
 import os
-import json
+import time
 import logging
 import asyncio
-from datetime import datetime
+from datetime import datetime, timezone
 from telethon import TelegramClient
+from telethon.errors import FloodWaitError
 from telethon.tl.types import Message
 from dotenv import load_dotenv
+from scraping.rate_limiter import TokenBucketLimiter
+from scraping.checkpoints import CheckpointStore
+from scraping.downloader import PhotoDownloader
+from scraping.image_store import ImageStore
+from scraping.lake_writer import NdjsonLakeWriter, merge_staged_partitions
+from scraping.parquet_lake import ParquetLakeWriter
+from enrichment.job_queue import JobQueue
 
 # --- Configuration ---
 load_dotenv()
@@ -17,77 +25,426 @@ API_HASH = os.getenv("TELEGRAM_API_HASH")
 # List of channels to scrape
 CHANNELS = ['ChemedHealth', 'lobelia4cosmetics', 'tikvahpharma']
 DATA_LAKE_PATH = 'data/raw/telegram_messages'
-IMAGE_PATH = 'data/raw/images'
+LAKE_FORMAT = os.getenv("LAKE_FORMAT", "ndjson") # 'ndjson' or 'parquet' (requires pyarrow)
 SCRAPE_LIMIT = 100 # Limit the number of messages to scrape per channel
 
+# --- Concurrency and Rate Limiting ---
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", 5)) # Channels scraped at the same time
+SCRAPE_RATE_PER_SECOND = float(os.getenv("SCRAPE_RATE_PER_SECOND", 1.0)) # Telegram requests per second, shared by all channels
+SCRAPE_BURST = int(os.getenv("SCRAPE_BURST", 5)) # Requests allowed in a burst before the rate applies
+SCRAPE_MAX_RETRIES = int(os.getenv("SCRAPE_MAX_RETRIES", 3)) # Retries per channel after a FloodWait
+HISTORY_PAGE_SIZE = 100 # Telethon fetches message history in pages of this size
+
+# --- Incremental Scraping and Backfill ---
+SCRAPE_MODE = os.getenv("SCRAPE_MODE", "incremental") # 'incremental' or 'backfill'
+BACKFILL_UNTIL = os.getenv("BACKFILL_UNTIL") # Oldest date to backfill to, e.g. '2024-01-01'
+BACKFILL_CHUNK_SIZE = int(os.getenv("BACKFILL_CHUNK_SIZE", 500)) # Messages fetched per backfill chunk
+
+# --- Photo Downloads ---
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", 4)) # Photos downloaded in parallel
+DOWNLOAD_QUEUE_SIZE = int(os.getenv("DOWNLOAD_QUEUE_SIZE", 200)) # Photos waiting for a worker before paging pauses
+DOWNLOAD_MAX_MB_IN_FLIGHT = int(os.getenv("DOWNLOAD_MAX_MB_IN_FLIGHT", 50)) # Total size of photos downloading at once
+DOWNLOAD_MAX_RETRIES = int(os.getenv("DOWNLOAD_MAX_RETRIES", 3)) # Retries per photo after a failed download
+DOWNLOAD_BACKOFF_SECONDS = float(os.getenv("DOWNLOAD_BACKOFF_SECONDS", 1.0)) # Base delay of the exponential backoff
+
+# --- Enrichment ---
+SUBMIT_ENRICHMENT_JOBS = os.getenv("SUBMIT_ENRICHMENT_JOBS", "1") == "1" # Queue a job for the enrichment worker after new photos
+
 # --- Logging Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-async def scrape_all_channels(client: TelegramClient):
+def create_lake_writer():
+    """Returns a writer for the configured lake format."""
+    return ParquetLakeWriter() if LAKE_FORMAT == 'parquet' else NdjsonLakeWriter(DATA_LAKE_PATH)
+
+class _ChannelBatch:
+    """
+    Streams the messages of one channel into the lake writer and tracks the
+    range of message ids seen. Messages with a photo are written once their
+    download finishes, so only photos still in flight are held in memory.
+    """
+
+    def __init__(self, channel_name: str, store: ImageStore, writer=None):
+        self.channel_name = channel_name
+        self.store = store
+        # A writer passed in is shared by several batches and closed by its owner
+        self._owns_writer = writer is None
+        self.writer = writer or create_lake_writer()
+        self.message_count = 0
+        self.photo_count = 0
+        self.newest = None # (message_id, date) of the newest message iterated
+        self.oldest = None # (message_id, date) of the oldest message iterated
+        self.pending_photos = {} # Callback writing a message once its photo is stored -> the download future
+        self.closed = False
+        self.failed_photos = [] # (message_id, date) of messages whose photo could not be downloaded
+
+    def track(self, message):
+        """Records the id range of every iterated message, including the ones we skip."""
+        if self.newest is None or message.id > self.newest[0]:
+            self.newest = (message.id, message.date)
+        if self.oldest is None or message.id < self.oldest[0]:
+            self.oldest = (message.id, message.date)
+
+    def add(self, date_str: str, message_data: dict, photo_future=None):
+        """Writes a message now, or as soon as its photo download finishes."""
+        self.message_count += 1
+        if photo_future is None:
+            self.writer.write(date_str, self.channel_name, message_data)
+            return
+
+        def on_downloaded(future):
+            # A callback already scheduled when the batch was closed must not reopen the writer
+            if self.closed:
+                return
+            self.pending_photos.pop(on_downloaded, None)
+            entry = None if future.cancelled() else future.result()
+            if entry:
+                # Record the image store reference and register the message as a user of the image
+                message_data.update(entry)
+                self.store.add_reference(entry, self.channel_name, message_data['id'])
+                self.photo_count += 1
+            else:
+                self.failed_photos.append((message_data['id'], datetime.fromisoformat(message_data['date'])))
+            self.writer.write(date_str, self.channel_name, message_data)
+
+        self.pending_photos[on_downloaded] = photo_future
+        photo_future.add_done_callback(on_downloaded)
+
+    async def wait_for_photos(self):
+        """Waits until every message waiting on a photo download has been written."""
+        while self.pending_photos:
+            await asyncio.gather(*set(self.pending_photos.values()), return_exceptions=True)
+            await asyncio.sleep(0) # Let the done callbacks run
+
+    def checkpoint_range(self):
+        """
+        Returns the (newest, oldest) marks to checkpoint. They stop short of any
+        message whose photo failed, so the next run fetches that message again
+        (the lake merges the re-fetched messages by id).
+        """
+        if not self.failed_photos:
+            return self.newest, self.oldest
+        first_failed, last_failed = min(self.failed_photos), max(self.failed_photos)
+        logging.warning(
+            f"{len(self.failed_photos)} photo(s) of '{self.channel_name}' could not be downloaded. "
+            f"Keeping the checkpoint before message {first_failed[0]} to retry them on the next run."
+        )
+        return (first_failed[0] - 1, first_failed[1]), (last_failed[0] + 1, last_failed[1])
+
+    def close(self):
+        """
+        Merges the written partitions into the lake, or only flushes them to
+        the staging files if the writer is shared. Messages still waiting for
+        a photo (when the scrape failed midway) are dropped, not written: their
+        downloads may be shared with other channels, so they are left running,
+        and the checkpoint was not moved, so the next run fetches them again.
+        """
+        self.closed = True
+        if self.pending_photos:
+            logging.warning(f"Dropping {len(self.pending_photos)} message(s) of '{self.channel_name}' still waiting for a photo.")
+        for callback, future in self.pending_photos.items():
+            future.remove_done_callback(callback)
+        self.pending_photos.clear()
+        if self._owns_writer:
+            self.writer.close()
+        else:
+            self.writer.flush()
+
+async def _process_message(message, downloader: PhotoDownloader, batch: _ChannelBatch):
+    """Queues the photo of a message (if any) for download and adds the message to the batch."""
+    # We only care about messages with text content
+    if not isinstance(message, Message) or not message.text:
+        return
+
+    # Messages are partitioned by date
+    message_date_str = message.date.strftime('%Y-%m-%d')
+
+    # Create a dictionary with the relevant message data
+    message_data = {
+        'id': message.id,
+        'date': message.date.isoformat(),
+        'text': message.text,
+        'sender_id': message.sender_id,
+        'photo_id': None,
+        'photo_sha256': None,
+        'photo_path': None
+    }
+
+    # If the message has a photo, queue it for download; the message is written once it is stored
+    photo_future = await downloader.submit(message.photo) if message.photo else None
+    batch.add(message_date_str, message_data, photo_future)
+
+async def _iterate_into_batch(client: TelegramClient, channel_name: str, entity, limiter: TokenBucketLimiter,
+                              downloader: PhotoDownloader, batch: _ChannelBatch, stop_before=None, **iter_kwargs):
+    """
+    Iterates a slice of channel history into the batch, taking a rate-limiter
+    token before every page request.
+
+    Returns:
+        tuple: (number of messages iterated, True if a message older than `stop_before` was reached)
+    """
+    iterated = 0
+    await limiter.acquire()
+    async for message in client.iter_messages(entity, **iter_kwargs):
+        # Take a token before Telethon requests the next page of history
+        iterated += 1
+        if iterated % HISTORY_PAGE_SIZE == 0:
+            await limiter.acquire()
+
+        if stop_before and message.date < stop_before:
+            return iterated, True
+
+        batch.track(message)
+        await _process_message(message, downloader, batch)
+    return iterated, False
+
+async def scrape_channel(client: TelegramClient, channel_name: str, limiter: TokenBucketLimiter,
+                         downloader: PhotoDownloader, checkpoints: CheckpointStore):
+    """
+    Scrapes the new messages of a single channel and streams them into
+    date-partitioned NDJSON files.
+
+    On the first run the newest SCRAPE_LIMIT messages are fetched. After that
+    only messages newer than the channel's checkpoint are fetched (`min_id`).
+
+    Args:
+        client (TelegramClient): An authenticated Telethon client instance.
+        channel_name (str): The username of the channel to scrape.
+        limiter (TokenBucketLimiter): The rate limiter shared by all channels.
+        downloader (PhotoDownloader): The background photo download queue.
+        checkpoints (CheckpointStore): The persistent per-channel high-water marks.
+
+    Returns:
+        dict: The number of messages and photos saved for the channel.
+    """
+    logging.info(f"--- Starting scrape for channel: {channel_name} ---")
+
+    # Get the channel entity (metadata) from Telegram
+    await limiter.acquire()
+    entity = await client.get_entity(channel_name)
+
+    checkpoint = checkpoints.get(channel_name)
+    if checkpoint and checkpoint.get('last_message_id'):
+        iter_kwargs = {'min_id': checkpoint['last_message_id'], 'limit': None}
+        logging.info(f"Fetching messages of '{channel_name}' newer than id {checkpoint['last_message_id']}.")
+    else:
+        iter_kwargs = {'limit': SCRAPE_LIMIT}
+        logging.info(f"No checkpoint for '{channel_name}'. Fetching the newest {SCRAPE_LIMIT} messages.")
+
+    batch = _ChannelBatch(channel_name, downloader.store)
+    try:
+        await _iterate_into_batch(client, channel_name, entity, limiter, downloader, batch, **iter_kwargs)
+        await batch.wait_for_photos()
+    finally:
+        # Whatever was written is merged into the lake, even if the scrape failed midway
+        batch.close()
+
+    # Only move the checkpoint once the messages are safely on disk, and not past a failed photo
+    newest, oldest = batch.checkpoint_range()
+    checkpoints.update(channel_name, newest=newest, oldest=oldest)
+    checkpoints.save()
+    return {'messages': batch.message_count, 'photos': batch.photo_count, 'failed_photos': len(batch.failed_photos)}
+
+async def backfill_channel(client: TelegramClient, channel_name: str, limiter: TokenBucketLimiter,
+                           downloader: PhotoDownloader, checkpoints: CheckpointStore, until_date: datetime,
+                           chunk_size: int = BACKFILL_CHUNK_SIZE):
+    """
+    Pages backwards through a channel's history in chunks of `chunk_size`
+    messages until `until_date` (or the first message of the channel) is reached.
+
+    Each chunk is saved and checkpointed before the next one is requested, so
+    an interrupted backfill resumes from the oldest message already stored.
+    Chunks are flushed to staging files; each partition is merged into the
+    lake once, when the channel is done (or by the next run, if this one stops).
+
+    Args:
+        client (TelegramClient): An authenticated Telethon client instance.
+        channel_name (str): The username of the channel to backfill.
+        limiter (TokenBucketLimiter): The rate limiter shared by all channels.
+        downloader (PhotoDownloader): The background photo download queue.
+        checkpoints (CheckpointStore): The persistent per-channel high-water marks.
+        until_date (datetime): Oldest message date to fetch (timezone-aware).
+        chunk_size (int): Number of messages requested per chunk.
+
+    Returns:
+        dict: The number of messages and photos saved for the channel.
+    """
+    logging.info(f"--- Starting backfill for channel: {channel_name} (until {until_date.date()}) ---")
+
+    checkpoint = checkpoints.get(channel_name) or {}
+    if checkpoint.get('reached_start') or (
+        checkpoint.get('oldest_message_date')
+        and datetime.fromisoformat(checkpoint['oldest_message_date']) <= until_date
+    ):
+        logging.info(f"Channel '{channel_name}' is already backfilled until {until_date.date()}.")
+        return {'messages': 0, 'photos': 0}
+
+    await limiter.acquire()
+    entity = await client.get_entity(channel_name)
+
+    # offset_id=0 starts from the newest message when the channel has never been scraped
+    offset_id = checkpoint.get('oldest_message_id', 0)
+    message_count = 0
+    photo_count = 0
+    failed_photo_count = 0
+    writer = create_lake_writer()
+    try:
+        while True:
+            batch = _ChannelBatch(channel_name, downloader.store, writer)
+            try:
+                iterated, reached_date = await _iterate_into_batch(
+                    client, channel_name, entity, limiter, downloader, batch,
+                    stop_before=until_date, offset_id=offset_id, limit=chunk_size
+                )
+                await batch.wait_for_photos()
+            finally:
+                batch.close()
+
+            reached_start = not reached_date and iterated < chunk_size and not batch.failed_photos
+            newest, oldest = batch.checkpoint_range()
+            checkpoints.update(channel_name, newest=newest, oldest=oldest, reached_start=reached_start)
+            checkpoints.save()
+
+            message_count += batch.message_count
+            photo_count += batch.photo_count
+            failed_photo_count += len(batch.failed_photos)
+            # Paging past a failed photo would move the checkpoint beyond it, so the next run resumes from there
+            if reached_date or reached_start or batch.oldest is None or batch.failed_photos:
+                break
+            offset_id = batch.oldest[0]
+            logging.info(f"Backfilled '{channel_name}' down to {batch.oldest[1].date()} (id {offset_id}).")
+    finally:
+        writer.close()
+
+    return {'messages': message_count, 'photos': photo_count, 'failed_photos': failed_photo_count}
+
+async def _scrape_channel_with_retries(scrape_func, channel_name: str, limiter: TokenBucketLimiter,
+                                       semaphore: asyncio.Semaphore):
+    """
+    Runs `scrape_func` for one channel inside the concurrency limit, retrying
+    after FloodWait errors and recording how long the channel took.
+
+    Returns:
+        dict: Per-channel statistics for the end-of-run report.
+    """
+    stats = {'channel': channel_name, 'messages': 0, 'photos': 0, 'failed_photos': 0, 'seconds': 0.0, 'status': 'ok'}
+    async with semaphore:
+        started = time.perf_counter()
+        for attempt in range(1, SCRAPE_MAX_RETRIES + 2):
+            try:
+                stats.update(await scrape_func(channel_name))
+                if stats['failed_photos']:
+                    stats['status'] = 'partial' # Saved, but some photos are retried on the next run
+                break
+            except FloodWaitError as e:
+                # Every task waits on the shared limiter, not only this one
+                limiter.penalize(e.seconds)
+                if attempt > SCRAPE_MAX_RETRIES:
+                    logging.error(f"Giving up on channel '{channel_name}' after {attempt} FloodWait errors.")
+                    stats['status'] = 'flood_wait'
+                    break
+                logging.warning(f"FloodWait while scraping '{channel_name}' (attempt {attempt}). Retrying.")
+            except Exception as e:
+                logging.error(f"Could not scrape channel '{channel_name}'. Reason: {e}")
+                stats['status'] = 'error'
+                break
+        stats['seconds'] = time.perf_counter() - started
+    return stats
+
+def log_scrape_report(results, total_seconds):
+    """Logs a per-channel summary table at the end of a scraping run."""
+    logging.info("--- Scrape report ---")
+    logging.info(f"{'channel':<30} {'status':<10} {'messages':>9} {'photos':>7} {'seconds':>8}")
+    for stats in results:
+        logging.info(
+            f"{stats['channel']:<30} {stats['status']:<10} {stats['messages']:>9} "
+            f"{stats['photos']:>7} {stats['seconds']:>8.1f}"
+        )
+    total_messages = sum(stats['messages'] for stats in results)
+    total_photos = sum(stats['photos'] for stats in results)
+    logging.info(
+        f"Scraped {total_messages} messages and {total_photos} photos from {len(results)} "
+        f"channels in {total_seconds:.1f} seconds."
+    )
+
+def _parse_backfill_date(value):
+    """Parses a backfill target date (e.g. '2024-01-01') into a timezone-aware UTC datetime."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+async def scrape_all_channels(client: TelegramClient, channels=None, concurrency: int = SCRAPE_CONCURRENCY,
+                              mode: str = SCRAPE_MODE, backfill_until=BACKFILL_UNTIL):
     """
     Connects to Telegram and scrapes messages from the specified channels.
 
+    Channels are scraped as concurrent asyncio tasks. A shared token bucket
+    limits the request rate across all of them and pauses every task when
+    Telegram returns a FloodWait.
+
     Args:
         client (TelegramClient): An authenticated Telethon client instance.
+        channels (list, optional): Channel usernames to scrape. Defaults to CHANNELS.
+        concurrency (int): Maximum number of channels scraped at the same time.
+        mode (str): 'incremental' fetches messages newer than each channel's checkpoint,
+            'backfill' pages backwards in chunks until `backfill_until`.
+        backfill_until (str or datetime, optional): Oldest date to fetch in backfill mode.
+
+    Returns:
+        list: Per-channel statistics (messages, photos, seconds, status).
     """
-    logging.info("Starting channel scraping process...")
-    for channel_name in CHANNELS:
-        try:
-            logging.info(f"--- Starting scrape for channel: {channel_name} ---")
-            
-            # Get the channel entity (metadata) from Telegram
-            entity = await client.get_entity(channel_name)
-            logging.info(f"Successfully got entity for '{channel_name}'. Now iterating messages.")
-
-            messages_by_date = {}
-
-            # Iterate through messages in the channel, up to the defined limit
-            async for message in client.iter_messages(entity, limit=SCRAPE_LIMIT):
-                # We only care about messages with text content
-                if not isinstance(message, Message) or not message.text:
-                    continue
-
-                # Group messages by date to create partitioned files
-                message_date_str = message.date.strftime('%Y-%m-%d')
-                if message_date_str not in messages_by_date:
-                    messages_by_date[message_date_str] = []
-
-                # If the message has a photo, download it and record its path
-                photo_filename = None
-                if message.photo:
-                    photo_dir = os.path.join(IMAGE_PATH, message_date_str, channel_name)
-                    os.makedirs(photo_dir, exist_ok=True)
-                    photo_filename = await client.download_media(message.photo, file=photo_dir)
-                    logging.info(f"Downloaded photo to: {photo_filename}")
-
-                # Create a dictionary with the relevant message data
-                message_data = {
-                    'id': message.id,
-                    'date': message.date.isoformat(),
-                    'text': message.text,
-                    'sender_id': message.sender_id,
-                    'photo_path': photo_filename
-                }
-                messages_by_date[message_date_str].append(message_data)
-
-            # Save the grouped messages into partitioned JSON files
-            for date_str, messages_list in messages_by_date.items():
-                file_dir = os.path.join(DATA_LAKE_PATH, date_str)
-                os.makedirs(file_dir, exist_ok=True)
-                file_path = os.path.join(file_dir, f"{channel_name}.json")
-
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(messages_list, f, ensure_ascii=False, indent=4)
-                logging.info(f"Saved {len(messages_list)} messages to {file_path}")
-
-        except Exception as e:
-            logging.error(f"Could not scrape channel '{channel_name}'. Reason: {e}")
-            continue # Move to the next channel if an error occurs
-
-        # Add a polite delay to avoid being rate-limited by Telegram
-        logging.info(f"Finished scraping {channel_name}. Waiting for 15 seconds...")
-        await asyncio.sleep(15)
-
-    logging.info("--- All channels scraped successfully ---")
-
-    
\ No newline at end of file
+    channels = channels or CHANNELS
+    logging.info(f"Starting {mode} scraping process for {len(channels)} channels (concurrency={concurrency})...")
+
+    # Let FloodWait errors reach the shared limiter instead of Telethon sleeping inside a single task
+    client.flood_sleep_threshold = 0
+
+    limiter = TokenBucketLimiter(rate=SCRAPE_RATE_PER_SECOND, capacity=SCRAPE_BURST)
+    semaphore = asyncio.Semaphore(concurrency)
+    checkpoints = CheckpointStore()
+    downloader = PhotoDownloader(
+        client, limiter, ImageStore(), workers=DOWNLOAD_WORKERS, queue_size=DOWNLOAD_QUEUE_SIZE,
+        max_bytes_in_flight=DOWNLOAD_MAX_MB_IN_FLIGHT * 1024 * 1024,
+        max_retries=DOWNLOAD_MAX_RETRIES, backoff_seconds=DOWNLOAD_BACKOFF_SECONDS
+    )
+
+    if mode == 'incremental':
+        async def scrape_func(channel_name):
+            return await scrape_channel(client, channel_name, limiter, downloader, checkpoints)
+    elif mode == 'backfill':
+        if not backfill_until:
+            raise ValueError("Backfill mode requires a target date (BACKFILL_UNTIL).")
+        until_date = _parse_backfill_date(backfill_until)
+
+        async def scrape_func(channel_name):
+            return await backfill_channel(client, channel_name, limiter, downloader, checkpoints, until_date)
+    else:
+        raise ValueError(f"Unknown scrape mode: '{mode}'. Expected 'incremental' or 'backfill'.")
+
+    if LAKE_FORMAT != 'parquet':
+        merge_staged_partitions(DATA_LAKE_PATH)
+
+    started = time.perf_counter()
+    downloader.start()
+    try:
+        results = await asyncio.gather(*[
+            _scrape_channel_with_retries(scrape_func, channel_name, limiter, semaphore)
+            for channel_name in channels
+        ])
+    finally:
+        await downloader.close()
+    log_scrape_report(results, time.perf_counter() - started)
+
+    if SUBMIT_ENRICHMENT_JOBS and any(stats['photos'] for stats in results):
+        queue = JobQueue()
+        job_id = queue.submit(source='scraper')
+        queue.close()
+        logging.info(f"Queued enrichment job {job_id} for the new photos.")
+
+    if all(stats['status'] == 'ok' for stats in results):
+        logging.info("--- All channels scraped successfully ---")
+    else:
+        logging.warning("--- Scraping finished with errors for some channels ---")
+    return results